@@ -0,0 +1,150 @@
+import os
+import json
+import logging
+import argparse
+
+from collections import deque
+from copy import deepcopy
+from .plan import normalize
+from .export import DEFAULT_FIELDS, exporter_for, format_of, open_output
+from .engine import LookupEngine, create_engines
+from .pipeline import ProcessParser
+from .schedule import BACKGROUND
+
+
+class Checkpoint:
+
+    def __init__(self, path):
+        self.path   = path
+        self.line   = 0
+        self.offset = 0
+        self.failed = []
+
+    def load(self, word_list, sources):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as fp:
+            state = json.load(fp)
+        if state['word_list'] != os.path.abspath(word_list) or state['sources'] != sources:
+            raise ValueError('Checkpoint {} belongs to another run, remove it to start over'.format(self.path))
+        self.line   = state['line']
+        self.offset = state['offset']
+        self.failed = state.get('failed', [])
+        return True
+
+    def reset(self):
+        self.line   = 0
+        self.offset = 0
+        self.failed = []
+
+    def save(self, word_list, sources, line, offset, failed):
+        self.line   = line
+        self.offset = offset
+        self.failed = list(failed)
+        state = {'word_list': os.path.abspath(word_list), 'sources': sources, 'line': line, 'offset': offset, 'failed': self.failed}
+        with open(self.path + '.tmp', 'w') as fp:
+            json.dump(state, fp)
+        os.replace(self.path + '.tmp', self.path)
+
+
+def run(word_list, output, sources, translate=False, max_workers=16, per_host=4, window=64, checkpoint_every=50, processes=0, retries=1):
+    # only complete records are written; keywords with a failed source are kept
+    # in the checkpoint and looked up again in up to `retries` passes at the end
+    checkpoint = Checkpoint(output + '.checkpoint')
+    resumed = checkpoint.load(word_list, sources)
+    if resumed and not os.path.exists(output):
+        logging.warning('{} is missing, start {} over'.format(output, word_list))
+        checkpoint.reset()
+        resumed = False
+    if resumed:
+        logging.info('Resume {} from line {} with {} failed words to retry'.format(word_list, checkpoint.line, len(checkpoint.failed)))
+
+    lines  = deque()
+    read   = [checkpoint.line]
+    failed = list(checkpoint.failed)
+    seen   = set(failed)
+
+    def keywords(fp):
+        for number, line in enumerate(fp):
+            keyword = normalize(line)
+            if number < checkpoint.line:
+                # already written or waiting in failed, only remember it
+                seen.add(keyword)
+                continue
+            read[0] = number + 1
+            if keyword and keyword not in seen:
+                seen.add(keyword)
+                lines.append(number)
+                yield keyword
+
+    pool   = ProcessParser(processes) if processes else None
+    lookup = LookupEngine(create_engines(translate, pool), max_workers=max_workers, per_host=per_host, priority=BACKGROUND)
+    done   = 0
+
+    fields = deepcopy(DEFAULT_FIELDS)
+    fields['translate']['requirment'] = translate
+
+    def write(exporter, keyword, result):
+        errors = {name: data for name, data in result.items() if isinstance(data, Exception)}
+        if errors:
+            logging.warning('Lookup of "{}" failed in {}'.format(keyword, ', '.join('{} ({})'.format(name, error) for name, error in errors.items())))
+            return False
+        exporter.write(keyword, result)
+        return True
+
+    try:
+        # anything written after the last checkpoint is redone, open_output drops it
+        with open(word_list, encoding='utf-8') as fp, open_output(output, offset=checkpoint.offset if resumed else None) as out:
+            exporter = exporter_for(out, format_of(output), fields)
+            for count, (keyword, result) in enumerate(lookup.search(keywords(fp), sources, return_exceptions=True, window=window), 1):
+                if write(exporter, keyword, result):
+                    done += 1
+                else:
+                    failed.append(keyword)
+                line = lines.popleft() + 1
+                if count % checkpoint_every == 0:
+                    out.flush()
+                    checkpoint.save(word_list, sources, line, out.buffer.tell(), failed)
+                    logging.info('{} words done, next line {}'.format(done, line))
+
+            for attempt in range(retries):
+                if not failed:
+                    break
+                logging.info('Retry {} failed words, pass {} of {}'.format(len(failed), attempt + 1, retries))
+                retry, failed = failed, []
+                for keyword, result in lookup.search(retry, sources, return_exceptions=True, window=window):
+                    if write(exporter, keyword, result):
+                        done += 1
+                    else:
+                        failed.append(keyword)
+            out.flush()
+            checkpoint.save(word_list, sources, read[0], out.buffer.tell(), failed)
+    finally:
+        if pool:
+            pool.close()
+    if failed:
+        logging.warning('{} words still failed, run again to retry them'.format(len(failed)))
+    logging.info('Finished {} words into {}'.format(done, output))
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Look up every line of a word list and stream the results in any export format')
+    parser.add_argument('word_list', help='file with one keyword per line')
+    parser.add_argument('-o', '--output', default='result.jsonl', help='.txt, .jsonl, .csv or .tsv, the format follows the extension')
+    parser.add_argument('-s', '--sources', nargs='+', default=['Cambridge', 'Merriam', 'Etymology'], choices=['Cambridge', 'Merriam', 'Etymology'])
+    parser.add_argument('-t', '--translate', action='store_true', help='include traditional chinese translations from Cambridge')
+    parser.add_argument('--max-workers', type=int, default=16)
+    parser.add_argument('--per-host', type=int, default=4)
+    parser.add_argument('--window', type=int, default=64, help='keywords submitted ahead of the one being written')
+    parser.add_argument('--checkpoint-every', type=int, default=50)
+    parser.add_argument('--processes', type=int, default=0, help='parse pages in this many worker processes, 0 parses in the lookup threads')
+    parser.add_argument('--retries', type=int, default=1, help='passes over the words that failed, at the end of the run')
+    args = parser.parse_args(argv)
+
+    from . import log  # noqa: F401
+    run(args.word_list, args.output, args.sources, args.translate, args.max_workers, args.per_host, args.window, args.checkpoint_every, args.processes, args.retries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+import os
+import gc
+import sys
+import glob
+import gzip
+import json
+import time
+import difflib
+import logging
+import argparse
+import tracemalloc
+
+from bs4.builder import builder_registry
+from . import dict as dictionary
+from .metrics import percentile
+from .model import encode
+from .engine import create_engines
+
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench')
+
+
+class FixtureStore:
+
+    # stand-in for download_page that only ever serves recorded pages
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, url):
+        for source, engine in create_engines(True).items():
+            if url.startswith(engine.prefix_url):
+                return os.path.join(self.directory, source, url[len(engine.prefix_url):] + '.html.gz')
+        raise KeyError('No fixture source for {}'.format(url))
+
+    def __call__(self, url):
+        path = self.path(url)
+        if not os.path.exists(path):
+            raise FileNotFoundError('{} has not been recorded, run the record command first'.format(path))
+        with gzip.open(path, 'rb') as fp:
+            return fp.read()
+
+    def record(self, url, page):
+        path = self.path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path, 'wb') as fp:
+            fp.write(page)
+
+
+def load_corpus(path):
+    with open(path) as fp:
+        corpus = json.load(fp)
+    return [(category, keyword) for category, keywords in corpus.items() for keyword in keywords]
+
+
+def target_of(keyword):
+    return dictionary.slug(keyword)
+
+
+def record(corpus, store, sources):
+    from .util import download_page, PageNotFound
+    engines = create_engines(True)
+    for category, keyword in corpus:
+        for source in sources:
+            url = engines[source].prefix_url + target_of(keyword)
+            try:
+                page = download_page(url)
+            except PageNotFound as e:
+                # the not found page is what the missing category is about
+                page = e.page
+            store.record(url, page)
+            logging.info('Recorded {} ({}) from {}'.format(keyword, category, source))
+
+
+def measure(engine, pages, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for page in pages:
+            start = time.perf_counter()
+            engine.parse(page)
+            latencies.append(time.perf_counter() - start)
+
+    # tracemalloc only sees live blocks, not every allocation: peak is the most
+    # the parse holds at once, kept is what its result still holds afterwards
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    tracemalloc.start()
+    peaks, blocks, sizes = [], [], []
+    for page in pages:
+        gc.collect()
+        before = tracemalloc.take_snapshot().filter_traces(ignore)
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = engine.parse(page)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        # soup trees are reference cycles, only count what outlives them
+        gc.collect()
+        changes = tracemalloc.take_snapshot().filter_traces(ignore).compare_to(before, 'filename')
+        blocks.append(sum(stat.count_diff for stat in changes if stat.count_diff > 0))
+        sizes.append(sum(stat.size_diff for stat in changes if stat.size_diff > 0))
+        del result
+    tracemalloc.stop()
+
+    return {
+        'pages': len(pages),
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p90_ms': percentile(latencies, 0.9) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'pages_per_sec': len(latencies) / sum(latencies),
+        'peak_kib': max(peaks) / 1024,
+        'kept_blocks_per_page': sum(blocks) / len(blocks),
+        'kept_kib_per_page': sum(sizes) / len(sizes) / 1024
+    }
+
+
+def check(engine, source, keyword, page, golden_dir, update):
+    output = json.dumps(engine.parse(page), ensure_ascii=False, indent=2, sort_keys=True, default=encode)
+    path = os.path.join(golden_dir, source, target_of(keyword) + '.json')
+    if update:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as fp:
+            fp.write(output + '\n')
+        return []
+    if not os.path.exists(path):
+        return ['{} is missing, review the output and run with --update-golden to create it'.format(path)]
+    with open(path, encoding='utf-8') as fp:
+        golden = fp.read().rstrip('\n')
+    diff = list(difflib.unified_diff(golden.splitlines(), output.splitlines(), path, 'current', lineterm=''))
+    if source == 'Cambridge':
+        reference = json.dumps(engine.parse_full(page), ensure_ascii=False, indent=2, sort_keys=True)
+        diff += list(difflib.unified_diff(reference.splitlines(), output.splitlines(), 'parse_full', 'parse', lineterm=''))
+    return diff
+
+
+def parity(fixture_dir, parsers=('lxml', 'html.parser')):
+    # the extractor must give exactly what parse_full gives, on every backend and
+    # for every recorded Cambridge page, whether or not it is in the corpus
+    paths = sorted(glob.glob(os.path.join(fixture_dir, 'Cambridge', '*.html.gz')))
+    if not paths:
+        print('No Cambridge pages under {}, run the record command first'.format(fixture_dir))
+        return 1
+    failures = 0
+    for parser in parsers:
+        if builder_registry.lookup(parser) is None:
+            failures += 1
+            print('The {} parser is not installed'.format(parser))
+            continue
+        for language in (None, 'chinese-traditional'):
+            engine = dictionary.CamBridge(language, parser)
+            for path in paths:
+                with gzip.open(path, 'rb') as fp:
+                    page = fp.read()
+                output    = json.dumps(engine.parse(page), ensure_ascii=False, indent=2, sort_keys=True, default=encode)
+                reference = json.dumps(engine.parse_full(page), ensure_ascii=False, indent=2, sort_keys=True)
+                diff = list(difflib.unified_diff(reference.splitlines(), output.splitlines(), 'parse_full', '{} {} {}'.format(path, parser, language), lineterm=''))
+                if diff:
+                    failures += 1
+                    print('\n'.join(diff))
+    print('{} pages, {} mismatches'.format(len(paths), failures))
+    return failures
+
+
+def run(corpus, store, sources, golden_dir, repeat=5, update=False):
+    engines = create_engines(True)
+    failures = 0
+    report = {}
+    for source in sources:
+        engine = engines[source]
+        pages = []
+        for category, keyword in corpus:
+            try:
+                page = store(engine.prefix_url + target_of(keyword))
+            except FileNotFoundError as e:
+                failures += 1
+                print(e)
+                continue
+            pages.append(page)
+            diff = check(engine, source, keyword, page, golden_dir, update)
+            if diff:
+                failures += 1
+                print('\n'.join(diff))
+        if pages:
+            report[source] = measure(engine, pages, repeat)
+
+    print('{:<10} {:>6} {:>9} {:>9} {:>9} {:>10} {:>9} {:>10} {:>9}'.format('source', 'pages', 'p50 ms', 'p90 ms', 'p99 ms', 'pages/s', 'peak KiB', 'kept blk', 'kept KiB'))
+    for source, stats in report.items():
+        print('{:<10} {pages:>6} {p50_ms:>9.2f} {p90_ms:>9.2f} {p99_ms:>9.2f} {pages_per_sec:>10.1f} {peak_kib:>9.0f} {kept_blocks_per_page:>10.0f} {kept_kib_per_page:>9.1f}'.format(source, **stats))
+    print('{} failures'.format(failures))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline parser benchmark and regression check over recorded pages')
+    parser.add_argument('command', choices=['record', 'run', 'parity'])
+    parser.add_argument('--corpus', default=os.path.join(BENCH_DIR, 'corpus.json'))
+    parser.add_argument('--fixtures', default=os.path.join(BENCH_DIR, 'fixtures'))
+    parser.add_argument('--golden', default=os.path.join(BENCH_DIR, 'golden'))
+    parser.add_argument('-s', '--sources', nargs='+', default=['Cambridge', 'Merriam', 'Etymology'], choices=['Cambridge', 'Merriam', 'Etymology'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--update-golden', action='store_true', help='overwrite the golden files with the current output')
+    args = parser.parse_args(argv)
+
+    from . import log  # noqa: F401
+    corpus = load_corpus(args.corpus)
+    store  = FixtureStore(args.fixtures)
+    if args.command == 'record':
+        record(corpus, store, args.sources)
+    elif args.command == 'parity':
+        sys.exit(1 if parity(args.fixtures) else 0)
+    else:
+        sys.exit(1 if run(corpus, store, args.sources, args.golden, args.repeat, args.update_golden) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+
+from collections import OrderedDict
+from .model import encode
+
+
+DAY = 24 * 60 * 60
+
+
+def cache_dir():
+    return os.environ.get('ENGLIPEDIA_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'englipedia'))
+
+
+class Cache:
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS raw (
+            url      TEXT PRIMARY KEY,
+            body     BLOB NOT NULL,
+            size     INTEGER NOT NULL,
+            created  REAL NOT NULL,
+            accessed REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS parsed (
+            source   TEXT NOT NULL,
+            language TEXT NOT NULL,
+            keyword  TEXT NOT NULL,
+            url      TEXT,
+            data     BLOB NOT NULL,
+            size     INTEGER NOT NULL,
+            created  REAL NOT NULL,
+            accessed REAL NOT NULL,
+            PRIMARY KEY (source, language, keyword)
+        );
+        CREATE TABLE IF NOT EXISTS redirects (
+            url       TEXT PRIMARY KEY,
+            canonical TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS raw_accessed ON raw (accessed);
+        CREATE INDEX IF NOT EXISTS parsed_accessed ON parsed (accessed);
+        CREATE INDEX IF NOT EXISTS parsed_url ON parsed (source, language, url);
+    '''
+
+    def __init__(self, path, raw_ttl=7 * DAY, parsed_ttl=30 * DAY, missing_ttl=DAY, max_bytes=256 * 1024 * 1024, memory_size=1024, bypass=False):
+        self.path        = path
+        self.raw_ttl     = raw_ttl
+        self.parsed_ttl  = parsed_ttl
+        self.missing_ttl = missing_ttl
+        self.max_bytes   = max_bytes
+        self.memory_size = memory_size
+        # bypass skips every read but keeps storing fresh results
+        self.bypass      = bypass
+
+        self._local  = threading.local()
+        self._lock   = threading.Lock()
+        self._memory = OrderedDict()
+        self._redirects = {}
+        self._writes = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.migrate()
+        self.connection.executescript(self.schema)
+
+    def migrate(self):
+        # parsed entries used to be keyed by their page url; they are only a cache, start over
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(parsed)')]
+        if columns and 'url' not in columns:
+            self.connection.execute('DROP TABLE parsed')
+            logging.info('Dropped the parsed entries of {} cached under the old key'.format(self.path))
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def entry_key(source, language, keyword):
+        return (source, language or '', ' '.join(keyword.lower().split()))
+
+    def canonical(self, url):
+        # remembered redirect target of url, or url itself
+        canonical = self._redirects.get(url)
+        if canonical is None:
+            row = self.connection.execute('SELECT canonical FROM redirects WHERE url = ?', (url,)).fetchone()
+            canonical = self._redirects[url] = row[0] if row else url
+        return canonical
+
+    def put_canonical(self, url, canonical):
+        if self._redirects.get(url) != canonical:
+            self._redirects[url] = canonical
+            self.connection.execute('REPLACE INTO redirects VALUES (?, ?)', (url, canonical))
+
+    def get_page(self, url):
+        if self.bypass:
+            return None
+        row = self.connection.execute('SELECT body, created FROM raw WHERE url = ?', (url,)).fetchone()
+        if row is None or row[1] + self.raw_ttl < time.time():
+            return None
+        self.connection.execute('UPDATE raw SET accessed = ? WHERE url = ?', (time.time(), url))
+        return zlib.decompress(row[0])
+
+    def put_page(self, url, body):
+        data = zlib.compress(body)
+        now  = time.time()
+        self.connection.execute('REPLACE INTO raw VALUES (?, ?, ?, ?, ?)', (url, data, len(data), now, now))
+        self._written()
+
+    def get_entry(self, source, language, keyword, decode=None):
+        if self.bypass:
+            return None
+        key = self.entry_key(source, language, keyword)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None and cached[0] + self.parsed_ttl >= time.time():
+                self._memory.move_to_end(key)
+                return cached[1]
+
+        row = self.connection.execute('SELECT data, created FROM parsed WHERE source = ? AND language = ? AND keyword = ?', key).fetchone()
+        if row is None or row[1] + self.parsed_ttl < time.time():
+            return None
+        self.connection.execute('UPDATE parsed SET accessed = ? WHERE source = ? AND language = ? AND keyword = ?', (time.time(),) + key)
+        data = json.loads(zlib.decompress(row[0]))
+        if decode:
+            data = decode(data)
+        self._remember(key, row[1], data)
+        return data
+
+    def find_entry(self, source, language, url, decode=None):
+        # an entry stored under any keyword whose page was url
+        if self.bypass:
+            return None
+        row = self.connection.execute(
+            'SELECT data, created FROM parsed WHERE source = ? AND language = ? AND url = ? ORDER BY created DESC LIMIT 1',
+            (source, language or '', url)
+        ).fetchone()
+        if row is None or row[1] + self.parsed_ttl < time.time():
+            return None
+        data = json.loads(zlib.decompress(row[0]))
+        return decode(data) if decode else data
+
+    def put_entry(self, source, language, keyword, data, ttl=None, url=None):
+        key  = self.entry_key(source, language, keyword)
+        blob = zlib.compress(json.dumps(data, ensure_ascii=False, default=encode).encode('utf-8'))
+        now  = time.time()
+        # a shorter ttl is stored as an older entry, so every expiry check stays the same
+        created = now if ttl is None else now - self.parsed_ttl + ttl
+        self.connection.execute('REPLACE INTO parsed VALUES (?, ?, ?, ?, ?, ?, ?, ?)', key + (url, blob, len(blob), created, now))
+        self._remember(key, created, data)
+        self._written()
+
+    def _remember(self, key, created, data):
+        with self._lock:
+            self._memory[key] = (created, data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _written(self):
+        with self._lock:
+            self._writes += 1
+            due = self._writes % 100 == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        now = time.time()
+        connection = self.connection
+        connection.execute('DELETE FROM raw WHERE created < ?', (now - self.raw_ttl,))
+        connection.execute('DELETE FROM parsed WHERE created < ?', (now - self.parsed_ttl,))
+
+        total = connection.execute('SELECT (SELECT IFNULL(SUM(size), 0) FROM raw) + (SELECT IFNULL(SUM(size), 0) FROM parsed)').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # drop least recently used rows over both tiers until we are under the cap
+        rows = connection.execute('''
+            SELECT 'raw', rowid, size, accessed FROM raw
+            UNION ALL
+            SELECT 'parsed', rowid, size, accessed FROM parsed
+            ORDER BY accessed
+        ''')
+        victims = {'raw': [], 'parsed': []}
+        for table, rowid, size, _ in rows:
+            if total <= self.max_bytes:
+                break
+            victims[table].append((rowid,))
+            total -= size
+        rows.close()
+        for table, ids in victims.items():
+            connection.executemany('DELETE FROM {} WHERE rowid = ?'.format(table), ids)
+        logging.info('Evicted {} raw pages and {} parsed entries from the cache'.format(len(victims['raw']), len(victims['parsed'])))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        self._redirects.clear()
+        self.connection.execute('DELETE FROM redirects')
+        self.connection.execute('DELETE FROM raw')
+        self.connection.execute('DELETE FROM parsed')
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = Cache(os.path.join(cache_dir(), 'cache.sqlite'), bypass=os.environ.get('ENGLIPEDIA_CACHE_BYPASS', '') not in ('', '0'))
+        return _cache
+
+
+def cached_entry(source, language, keyword, fetch, decode=None):
+    cache = get_cache()
+    data  = cache.get_entry(source, language, keyword, decode)
+    if data is None:
+        # fetch returns the data with its ttl, None for the default one, and the page it came from
+        data, ttl, url = fetch()
+        if hasattr(data, 'then'):
+            # still being parsed elsewhere, stored once the result is collected
+            return data.then(lambda result: cache.put_entry(source, language, keyword, result, ttl, url))
+        cache.put_entry(source, language, keyword, data, ttl, url)
+    return data
@@ -0,0 +1,131 @@
+import time
+import logging
+import threading
+import requests
+
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from . import metrics
+from .schedule import Scheduler
+
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_2) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/47.0.2526.80 Safari/537.36'
+
+
+class HttpClient:
+
+    retry_status    = frozenset([429, 500, 502, 503, 504])
+    throttle_status = frozenset([429, 503])
+
+    def __init__(self, pool_size=8, timeout=(5, 20), retries=3, backoff=0.5, scheduler=None):
+        self.scheduler = scheduler or Scheduler()
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': USER_AGENT,
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        })
+        # urllib3 keeps one pool per host behind every adapter
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'retries': 0,
+            'errors': 0,
+            'bytes_received': 0,
+            'bytes_decoded': 0
+        }
+
+    def _count(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self._stats[key] += value
+
+    def retry_delay(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * (2 ** attempt)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlparse(url).netloc
+        for attempt in range(self.retries + 1):
+            with metrics.timer('schedule_wait_seconds', host=host):
+                self.scheduler.acquire(host)
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, **kwargs)
+                content  = response.content
+            except (requests.ConnectionError, requests.Timeout) as error:
+                metrics.inc('http_errors', host=host, error=type(error).__name__)
+                self._count(requests=1, errors=1)
+                if attempt == self.retries:
+                    raise
+                logging.warning('Request to {} failed ({}), retrying'.format(url, error))
+                self._count(retries=1)
+                time.sleep(self.retry_delay(attempt))
+                continue
+
+            # elapsed stops once the headers are parsed: connect, TLS and server time;
+            # the rest of the request is spent reading and decoding the body
+            total = time.perf_counter() - start
+            received = response.raw.tell() or len(content)
+            metrics.inc('http_requests', host=host, status=response.status_code)
+            metrics.observe('http_request_seconds', total, host=host)
+            metrics.observe('http_wait_seconds', response.elapsed.total_seconds(), host=host)
+            metrics.observe('http_transfer_seconds', max(0.0, total - response.elapsed.total_seconds()), host=host)
+            metrics.observe('http_response_bytes', received, host=host)
+            self._count(requests=1, bytes_received=received, bytes_decoded=len(content))
+            if response.status_code in self.throttle_status:
+                # the scheduler pauses and slows down every request to this host, not just this one
+                self.scheduler.throttled(host, self.retry_delay(attempt, response))
+            else:
+                self.scheduler.succeeded(host)
+            if response.status_code not in self.retry_status or attempt == self.retries:
+                return response
+            logging.warning('Request to {} returned {}, retrying'.format(url, response.status_code))
+            self._count(retries=1)
+            if response.status_code not in self.throttle_status:
+                time.sleep(self.retry_delay(attempt, response))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        connections = requests_sent = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections   += pool.num_connections
+                    requests_sent += pool.num_requests
+        stats['connections'] = connections
+        stats['pool_hits']   = requests_sent - connections
+        stats['hosts']       = self.scheduler.stats()
+        return stats
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def set_client(client):
+    # replace the shared client, e.g. to point a service at a different rate limit
+    global _client
+    with _client_lock:
+        _client = client
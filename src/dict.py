@@ -1,17 +1,77 @@
+import os
 import re
 import logging
 
 from copy import copy
 from bs4  import BeautifulSoup
-from .util import download_page, rebuild_string
+from .util import fetch_page, rebuild_string, PageNotFound
+from .cache import get_cache, cached_entry
+from .index import ingest
+from .snapshot import get_snapshot
+from .media import get_media
+from . import metrics
+from .extract import CambridgeExtractor
+from .model import entries_from_dicts
+
+
+def slug(keyword):
+    return '-'.join(word.strip() for word in keyword.split())
+
+
+def fetch_entry(source, language, target, url, parse, decode=None, pool=None, use_snapshot=True):
+    # parsed results are keyed by the normalized keyword and remember the page
+    # they came from, so every spelling that redirects to the same lemma shares one fetch and one parse
+    cache = get_cache()
+
+    def store(data):
+        metrics.observe('entries', len(data), source=source)
+        ingest(source, language, target, data)
+        return data
+
+    def fetch():
+        metrics.inc('entry_cache', source=source, result='miss')
+        canonical = cache.canonical(url)
+        if canonical != url:
+            data = cache.find_entry(source, language, canonical, decode)
+            if data is not None:
+                return data, None, canonical
+        try:
+            canonical, page = fetch_page(url)
+        except PageNotFound as e:
+            # the empty result of the 404 page is kept, but only for missing_ttl
+            metrics.inc('not_found', source=source)
+            return parse(e.page), cache.missing_ttl, url
+        if canonical != url:
+            data = cache.find_entry(source, language, canonical, decode)
+            if data is not None:
+                return data, None, canonical
+        if pool:
+            # the lookup thread gives its host slot back as soon as the page is handed over
+            return pool.submit(source, language, page).then(store), None, canonical
+        with metrics.timer('parse_seconds', source=source):
+            data = parse(page)
+        return store(data), None, canonical
+
+    with metrics.timer('search_seconds', source=source):
+        metrics.inc('searches', source=source)
+        snapshot = get_snapshot() if use_snapshot else None
+        if snapshot is not None:
+            data = snapshot.get(source, language, target, decode)
+            metrics.inc('snapshot', source=source, result='miss' if data is None else 'hit')
+            if data is not None:
+                return data
+        return cached_entry(source, language, target, fetch, decode)
 
 
 class CamBridge:
 
     base_url = 'https://dictionary.cambridge.org/dictionary/'
+    pool     = None
+    use_snapshot = True
 
-    def __init__(self, language):
+    def __init__(self, language, parser=None):
         self.language  = language
+        self.extractor = CambridgeExtractor(language, parser)
         self.prefix_url = self.base_url + ('english-{language}/'.format(language=language.strip()) if language else 'english/')
 
     def extract_head(self, head):
@@ -96,15 +156,24 @@ class CamBridge:
                         word['defines'][-1]['phrases'].append(body)
             yield word
 
+    def parse(self, page):
+        return entries_from_dicts(self.extractor.extract(page))
+
+    def parse_full(self, page):
+        # reference implementation over the whole document, kept to check the extractor against
+        soup = BeautifulSoup(page, 'html.parser')
+        return list(self.find_word(soup)) + list(self.find_phrase(soup))
+
     def search(self, keyword):
-        target = '-'.join(word.strip() for word in keyword.split())
-        soup   = BeautifulSoup(download_page(self.prefix_url + target), 'html.parser')
+        target = slug(keyword)
         logging.info('Search the query "{}" in CamBridge'.format(target))
-        return list(self.find_word(soup)) + list(self.find_phrase(soup))
+        return fetch_entry('Cambridge', self.language, target, self.prefix_url + target, self.parse, decode=entries_from_dicts, pool=self.pool, use_snapshot=self.use_snapshot)
 
 class MerriamWebster:
 
     base_url = 'https://www.merriam-webster.com/dictionary/'
+    pool     = None
+    use_snapshot = True
 
     def __init__(self):
         self.prefix_url = self.base_url
@@ -141,26 +210,30 @@ class MerriamWebster:
 
         return data_list
 
-    def search(self, keyword):
-        target = '-'.join(word.strip() for word in keyword.split())
-        logging.info('Search the query "{}" in Merriam-Webster'.format(target))
-        soup = BeautifulSoup(download_page(self.prefix_url + target), 'html.parser')
+    def parse(self, page):
+        soup = BeautifulSoup(page, 'html.parser')
         return {
             'first_known_use': self.extract_body(soup, div_id='first-known-anchor', text_class='ety-sl'),
             'etymology': self.extract_body(soup, div_id='etymology-anchor', text_class='et')
         }
 
+    def search(self, keyword):
+        target = slug(keyword)
+        logging.info('Search the query "{}" in Merriam-Webster'.format(target))
+        return fetch_entry('Merriam', None, target, self.prefix_url + target, self.parse, pool=self.pool, use_snapshot=self.use_snapshot)
+
 class OnlineEtymology:
 
     base_url = 'https://www.etymonline.com/word/'
+    pool     = None
+    use_snapshot = True
+    media    = False
 
     def __init__(self):
         self.prefix_url = self.base_url
 
-    def search(self, keyword):
-        target = '-'.join(word.strip() for word in keyword.split())
-        logging.info('Search the query "{}" in OnlineEtymology'.format(target))
-        soup = BeautifulSoup(download_page(self.prefix_url + target), 'html.parser')
+    def parse(self, page):
+        soup = BeautifulSoup(page, 'html.parser')
         word_label = soup.find('section', class_='word__defination--2q7ZH')
         chart_label = soup.find('div', class_='chart')
 
@@ -168,3 +241,20 @@ class OnlineEtymology:
             'text': word_label.text if word_label else None,
             'image_url': chart_label.get('data-origin-path') if chart_label else None
         }
+
+    def search(self, keyword):
+        target = slug(keyword)
+        logging.info('Search the query "{}" in OnlineEtymology'.format(target))
+        data = fetch_entry('Etymology', None, target, self.prefix_url + target, self.parse, pool=self.pool, use_snapshot=self.use_snapshot)
+        if not self.media:
+            return data
+        if hasattr(data, 'then'):
+            return data.then(self.prefetch)
+        self.prefetch(data)
+        return data
+
+    @staticmethod
+    def prefetch(data):
+        # charts download in the background while the other sources are still looked up
+        if data['image_url'] and os.environ.get('ENGLIPEDIA_MEDIA', '1') != '0':
+            get_media().prefetch(data['image_url'])
@@ -0,0 +1,97 @@
+import time
+import threading
+
+from itertools import islice
+from collections import deque
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from .dict import CamBridge, MerriamWebster, OnlineEtymology
+from .schedule import INTERACTIVE, lane
+from .pipeline import Pending
+
+
+def create_engines(translate, pool=None, media=False, use_snapshot=True):
+    engines = {
+        'Cambridge': CamBridge('chinese-traditional' if translate else None),
+        'Merriam': MerriamWebster(),
+        'Etymology': OnlineEtymology()
+    }
+    # with a process pool the lookup threads only fetch and search returns a
+    # Pending for pages that still have to be parsed
+    for engine in engines.values():
+        engine.pool = pool
+        engine.use_snapshot = use_snapshot
+    # only the notebook shows charts, headless lookups never download them
+    engines['Etymology'].media = media
+    return engines
+
+
+class Fanout:
+
+    # one pool per upstream host caps the per-host concurrency, the shared
+    # semaphore caps the number of lookups in flight over all hosts
+    def __init__(self, engine, dict_names):
+        self.engine     = engine
+        self.dict_names = dict_names
+        self.slots      = threading.BoundedSemaphore(engine.max_workers)
+        self.pools      = {host: ThreadPoolExecutor(max_workers=engine.per_host) for host in {engine.host(name) for name in dict_names}}
+
+    def submit(self, keyword):
+        return {name: self.pools[self.engine.host(name)].submit(self.engine.lookup, self.slots, name, keyword) for name in self.dict_names}
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+class LookupEngine:
+
+    def __init__(self, engines, max_workers=16, per_host=4, priority=INTERACTIVE):
+        self.engines     = engines
+        self.max_workers = max_workers
+        self.per_host    = per_host
+        self.priority    = priority
+        self.latency     = {}
+        self._lock       = threading.Lock()
+
+    def host(self, dict_name):
+        return urlparse(self.engines[dict_name].base_url).netloc
+
+    def lookup(self, slots, dict_name, keyword):
+        with slots, lane(self.priority):
+            start = time.perf_counter()
+            try:
+                return self.engines[dict_name].search(keyword)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    count, total = self.latency.get(dict_name, (0, 0.0))
+                    self.latency[dict_name] = (count + 1, total + elapsed)
+
+    def mean_latency(self):
+        with self._lock:
+            return {name: total / count for name, (count, total) in self.latency.items()}
+
+    @staticmethod
+    def outcome(future, return_exceptions):
+        try:
+            result = future.result()
+            return result.result() if isinstance(result, Pending) else result
+        except Exception as e:
+            if return_exceptions:
+                return e
+            raise
+
+    def search(self, keywords, dict_names, return_exceptions=False, window=None):
+        # with a window only that many keywords are submitted ahead of the one yielded
+        fanout   = Fanout(self, dict_names)
+        keywords = iter(keywords)
+        try:
+            pending = deque((keyword, fanout.submit(keyword)) for keyword in islice(keywords, window))
+            while pending:
+                keyword, futures = pending.popleft()
+                for keyword_next in islice(keywords, 1):
+                    pending.append((keyword_next, fanout.submit(keyword_next)))
+                yield keyword, {name: self.outcome(future, return_exceptions) for name, future in futures.items()}
+        finally:
+            fanout.close()
@@ -0,0 +1,197 @@
+import io
+import os
+import csv
+import gzip
+import html
+import json
+
+from . import metrics
+from .model import encode, NO_TRANSLATION
+from .render import Renderer
+
+
+DEFAULT_FIELDS = {
+    'Cambridge': {
+        'word'  : {'define': True, 'pos': True, 'grammar': True, 'examples': True},
+        'phrase': {'text': True, 'define': True, 'examples': True}
+    },
+    'Merriam': {'first use': True, 'etymology': True},
+    'Etymology': {'description': True, 'image(if any)': True},
+    'translate': {'requirment': True}
+}
+
+FORMATS = ('txt', 'jsonl', 'csv', 'tsv')
+
+
+def select(result, fields):
+    # plain dict of a lookup result restricted to the fields chosen in the UI
+    word_field   = fields['Cambridge']['word']
+    phrase_field = fields['Cambridge']['phrase']
+    translate    = fields['translate']['requirment']
+
+    def sense(define, grammar):
+        data = {'text': define['define']['text']}
+        if translate:
+            data['translate'] = define['define']['translate']
+        if word_field['grammar'] and grammar:
+            data['grammar'] = grammar
+        if word_field['examples']:
+            data['examples'] = [example_of(example) for example in define['examples']]
+        if phrase_field['text'] and define['phrases']:
+            data['phrases'] = [phrase_of(phrase) for phrase in define['phrases']]
+        return data
+
+    def phrase_of(phrase):
+        data = {'phrase': phrase['phrase']}
+        if phrase_field['define']:
+            data['text'] = phrase['define']['text']
+            if translate:
+                data['translate'] = phrase['define']['translate']
+        if phrase_field['examples']:
+            data['examples'] = [example_of(example) for example in phrase['examples']]
+        return data
+
+    def example_of(example):
+        return {'text': example['text'], 'translate': example['translate']} if translate else {'text': example['text']}
+
+    data = {}
+    if 'Cambridge' in result:
+        data['Cambridge'] = []
+        for word in result['Cambridge']:
+            entry = {'text': word['text']}
+            if word_field['pos']:
+                entry['pos'] = word['pos']
+            if word_field['define']:
+                entry['defines'] = [sense(define, define.get('grammar', word.get('grammar'))) for define in word['defines']]
+            data['Cambridge'].append(entry)
+    if result.get('Merriam'):
+        merriam_field = fields['Merriam']
+        data['Merriam'] = {}
+        if merriam_field['first use']:
+            data['Merriam']['first_known_use'] = result['Merriam']['first_known_use']
+        if merriam_field['etymology']:
+            data['Merriam']['etymology'] = result['Merriam']['etymology']
+    if result.get('Etymology'):
+        etymology_field = fields['Etymology']
+        data['Etymology'] = {}
+        if etymology_field['description']:
+            data['Etymology']['text'] = result['Etymology']['text']
+        if etymology_field['image(if any)']:
+            data['Etymology']['image_url'] = result['Etymology']['image_url']
+    return data
+
+
+class TextExporter:
+
+    def __init__(self, fp, fields):
+        self.fp       = fp
+        self.fields   = fields
+        self.renderer = Renderer()
+
+    def write(self, keyword, result):
+        self.renderer.write({keyword: result}, self.fields, self.fp)
+        # fragments are only reused inside one entry, do not let them pile up
+        self.renderer.clear()
+
+
+class JsonlExporter:
+
+    def __init__(self, fp, fields):
+        self.fp     = fp
+        self.fields = fields
+
+    def write(self, keyword, result):
+        record = dict(keyword=keyword, **select(result, self.fields))
+        self.fp.write(json.dumps(record, ensure_ascii=False, default=encode))
+        self.fp.write('\n')
+
+
+class FlashcardExporter:
+
+    # one Anki note per definition or phrase: front, back, etymology, tags
+    def __init__(self, fp, fields, delimiter=','):
+        self.fields = fields
+        self.writer = csv.writer(fp, delimiter=delimiter, lineterminator='\n')
+
+    @staticmethod
+    def translated(item):
+        # anki fields are html, so the text is escaped before it is joined with <br>
+        text = html.escape(item.get('text') or '')
+        if item.get('translate') and item['translate'] != NO_TRANSLATION:
+            text += ' ({})'.format(html.escape(item['translate']))
+        return text
+
+    def back(self, sense):
+        lines = [self.translated(sense)]
+        if sense.get('grammar'):
+            lines[0] += ' [{}]'.format(html.escape(sense['grammar']))
+        for example in sense.get('examples', []):
+            lines.append('- ' + self.translated(example))
+        return '<br>'.join(line for line in lines if line)
+
+    def write(self, keyword, result):
+        data = select(result, self.fields)
+        notes = []
+        for item in data.get('Merriam', {}).get('etymology', []):
+            notes.append(html.escape(item['text']))
+        if data.get('Etymology', {}).get('text'):
+            notes.append(html.escape(data['Etymology']['text'].strip()))
+        etymology = '<br>'.join(notes)
+
+        rows = 0
+        for word in data.get('Cambridge', []):
+            front = html.escape(word['text'] + (' ({})'.format(word['pos']) if word.get('pos') else ''))
+            tags  = ' '.join(tag.replace(' ', '_') for tag in ('englipedia', word.get('pos')) if tag)
+            for define in word.get('defines', []):
+                self.writer.writerow([front, self.back(define), etymology, tags])
+                rows += 1
+                for phrase in define.get('phrases', []):
+                    self.writer.writerow([html.escape(phrase['phrase']), self.back(phrase), etymology, 'englipedia phrase'])
+                    rows += 1
+        if not rows and etymology:
+            self.writer.writerow([html.escape(keyword), '', etymology, 'englipedia'])
+
+
+def exporter_for(fp, fmt, fields):
+    if fmt == 'txt':
+        return TextExporter(fp, fields)
+    if fmt == 'jsonl':
+        return JsonlExporter(fp, fields)
+    if fmt in ('csv', 'tsv'):
+        return FlashcardExporter(fp, fields, delimiter=',' if fmt == 'csv' else '\t')
+    raise ValueError('Unknown export format {}, expected one of {}'.format(fmt, ', '.join(FORMATS)))
+
+
+def format_of(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return os.path.splitext(name)[1].lstrip('.') or 'txt'
+
+
+def open_output(path, buffer_size=1 << 20, offset=None):
+    # offset resumes an uncompressed file: whatever follows that byte is dropped
+    if path.endswith('.gz'):
+        if offset is not None:
+            raise ValueError('{} is compressed and cannot be resumed at a byte offset'.format(path))
+        raw = gzip.open(path, 'wb', compresslevel=6)
+    elif offset is None:
+        raw = open(path, 'wb', buffering=0)
+    else:
+        raw = open(path, 'r+b', buffering=0)
+        raw.truncate(offset)
+        raw.seek(offset)
+    return io.TextIOWrapper(io.BufferedWriter(raw, buffer_size), encoding='utf-8', newline='')
+
+
+def export(entries, path, fields=None, fmt=None, buffer_size=1 << 20):
+    # entries is any iterable of (keyword, result), written as it is consumed
+    fields = fields or DEFAULT_FIELDS
+    fmt    = fmt or format_of(path)
+    count = 0
+    with metrics.timer('export_seconds', format=fmt):
+        with open_output(path, buffer_size) as fp:
+            exporter = exporter_for(fp, fmt, fields)
+            for keyword, result in entries:
+                exporter.write(keyword, result)
+                count += 1
+    metrics.observe('exported_entries', count, format=fmt)
+    return count
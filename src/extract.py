@@ -0,0 +1,182 @@
+import re
+import os
+
+from bisect import bisect_right
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+from . import metrics
+from .util import rebuild_string
+
+
+PHRASE_BLOCK = re.compile('(pv|idiom)-block')
+SENSE_BLOCK  = re.compile('^pr dsense')
+ENTRY_MARKER = re.compile(rb'entry-body__el|pv-block|idiom-block')
+
+
+def default_parser():
+    # lxml unless it is missing or ENGLIPEDIA_PARSER=html.parser asks otherwise
+    parser = os.environ.get('ENGLIPEDIA_PARSER', 'lxml')
+    if parser == 'lxml':
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            parser = 'html.parser'
+    return parser
+
+
+def is_entry_class(value):
+    # the strainer may see the class attribute as a single string or per value
+    if not value:
+        return False
+    return 'entry-body__el' in value.split() or bool(PHRASE_BLOCK.search(value))
+
+
+def skip_preamble(page):
+    # nothing before the first entry block can match, so do not tokenize it at all
+    if isinstance(page, str):
+        page = page.encode('utf-8')
+    found = ENTRY_MARKER.search(page)
+    if not found:
+        return page
+    start = page.rfind(b'<', 0, found.start())
+    return page[start:] if start > 0 else page
+
+
+class TagIndex:
+
+    # walk the tree once and remember, for every (tag name, class) pair, the tags
+    # in document order plus the span of positions each tag covers, so nested
+    # find/find_all calls become binary searches instead of re-scans
+    def __init__(self, root):
+        self.span = {}
+        self.keys = {}
+        self.position = 0
+        self.visit(root)
+
+    def visit(self, tag):
+        start = self.position
+        self.position += 1
+        classes = tag.get('class') or []
+        keys = {(tag.name, None), (tag.name, ' '.join(classes))}
+        keys.update((tag.name, name) for name in classes)
+        for key in keys:
+            starts, tags = self.keys.setdefault(key, ([], []))
+            starts.append(start)
+            tags.append(tag)
+        for child in tag.contents:
+            if isinstance(child, Tag):
+                self.visit(child)
+        self.span[id(tag)] = (start, self.position - 1)
+
+    def _range(self, tag, name, class_):
+        starts, tags = self.keys.get((name, class_), ((), ()))
+        start, end = self.span[id(tag)]
+        return tags, bisect_right(starts, start), bisect_right(starts, end)
+
+    def find(self, tag, name, class_):
+        if id(tag) not in self.span:
+            return tag.find(name, class_=class_)
+        tags, low, high = self._range(tag, name, class_)
+        return tags[low] if low < high else None
+
+    def find_all(self, tag, name, class_=None):
+        tags, low, high = self._range(tag, name, class_)
+        return tags[low:high]
+
+    def find_all_matching(self, tag, name, pattern):
+        return [
+            found for found in self.find_all(tag, name)
+            if found.get('class') and (any(pattern.search(c) for c in found['class']) or pattern.search(' '.join(found['class'])))
+        ]
+
+
+class CambridgeExtractor:
+
+    def __init__(self, language, parser=None):
+        self.language = language
+        self.parser   = parser or default_parser()
+        self.strainer = SoupStrainer('div', class_=is_entry_class)
+
+    @staticmethod
+    def text_of(tag):
+        return rebuild_string(text.strip() for text in tag.find_all(string=True) if text.strip())
+
+    def extract_head(self, index, head):
+        pos = index.find(head, 'span', 'pos dpos')
+        word = {
+            'text': index.find(head, 'span', 'hw dhw').text,
+            'pos' : pos.text if pos else None
+        }
+
+        if word['pos'] == 'verb':
+            word['grammar'] = ' '.join(g.text for g in index.find_all(head, 'span', 'gc dgc'))
+
+        return word
+
+    def extract_body(self, index, body):
+        for def_block in index.find_all(body, 'div', 'def-block ddef_block'):
+            define    = self.text_of(index.find(index.find(def_block, 'div', 'ddef_h'), 'div', 'def ddef_d db'))
+            grammar   = index.find_all(def_block, 'span', 'gc dgc')
+            translate = index.find(index.find(def_block, 'div', 'def-body ddef_b'), 'span', 'trans dtrans dtrans-se') if self.language else None
+            examples  = []
+            for example_soup in index.find_all(def_block, 'div', 'examp dexamp'):
+                trans_example = index.find(example_soup, 'span', 'trans dtrans dtrans-se hdb') if self.language else None
+                examples.append({
+                    'text': self.text_of(index.find(example_soup, 'span', 'eg deg')),
+                    'translate': trans_example.text if trans_example else '無翻譯'
+                })
+
+            body_data = {
+                'define': {
+                    'text': define,
+                    'translate':  translate.text if translate else '無翻譯'
+                },
+                'examples': examples,
+                'phrases': []
+            }
+
+            if grammar:
+                body_data['grammar'] = ' '.join(g.text for g in grammar)
+
+            parent = def_block.parent
+            if parent['class'][0] == 'phrase-body':
+                body_data['type'] = 'phrase'
+                body_data['phrase'] = index.find(parent.previous_sibling, 'span', 'phrase-title dphrase-title').text.strip()
+            else:
+                body_data['type'] = 'define'
+
+            yield body_data
+
+    def collect(self, word, bodies):
+        for body in bodies:
+            if body.pop('type') == 'define':
+                word['defines'].append(body)
+            else:
+                if not len(word['defines']):
+                    word['defines'].append(body)
+                word['defines'][-1]['phrases'].append(body)
+        return word
+
+    def find_word(self, index, soup):
+        for word_soup in index.find_all(soup, 'div', 'pr entry-body__el'):
+            word = self.extract_head(index, index.find(word_soup, 'div', 'pos-header dpos-h'))
+            word['defines'] = []
+            yield self.collect(word, self.extract_body(index, index.find(word_soup, 'div', 'pos-body')))
+
+    def find_phrase(self, index, soup):
+        for phrase_soup in index.find_all_matching(soup, 'div', PHRASE_BLOCK):
+            pos_pkt = index.find(phrase_soup, 'div', 'pos-header dpos-h')
+            word = {
+                'text': index.find(phrase_soup, 'h2', 'headword tw-bw dhw dpos-h_hw').text.strip(),
+                'pos': index.find(pos_pkt, 'span', 'pos dpos').text.strip() if pos_pkt else None,
+                'defines': []
+            }
+            for define_soup in index.find_all_matching(phrase_soup, 'div', SENSE_BLOCK):
+                self.collect(word, self.extract_body(index, define_soup))
+            yield word
+
+    def extract(self, page):
+        with metrics.timer('soup_seconds', source='Cambridge', parser=self.parser):
+            soup = BeautifulSoup(skip_preamble(page), self.parser, parse_only=self.strainer, from_encoding='utf-8')
+        with metrics.timer('extract_seconds', source='Cambridge'):
+            index = TagIndex(soup)
+            return list(self.find_word(index, soup)) + list(self.find_phrase(index, soup))
@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import zlib
+import sqlite3
+import logging
+import threading
+
+from .cache import cache_dir
+
+
+class Index:
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS entries (
+            id        INTEGER PRIMARY KEY,
+            keyword   TEXT NOT NULL,
+            source    TEXT NOT NULL,
+            language  TEXT NOT NULL DEFAULT '',
+            headword  TEXT,
+            pos       TEXT,
+            grammar   TEXT,
+            kind      TEXT NOT NULL,
+            text      TEXT NOT NULL,
+            translate TEXT
+        );
+        CREATE INDEX IF NOT EXISTS entries_headword ON entries (headword COLLATE NOCASE);
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5 (
+            headword, text, translate,
+            content='entries', content_rowid='id', prefix='2 3'
+        );
+        CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+            INSERT INTO entries_fts (rowid, headword, text, translate) VALUES (new.id, new.headword, new.text, new.translate);
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, headword, text, translate) VALUES ('delete', old.id, old.headword, old.text, old.translate);
+        END;
+    '''
+
+    def __init__(self, path):
+        self.path   = path
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection.executescript(self.schema)
+        self.migrate()
+
+    def migrate(self):
+        # indexes from before translated and plain Cambridge entries were kept apart
+        columns = [row['name'] for row in self.connection.execute('PRAGMA table_info(entries)')]
+        with self.connection as connection:
+            if 'language' not in columns:
+                connection.execute("ALTER TABLE entries ADD COLUMN language TEXT NOT NULL DEFAULT ''")
+                logging.info('Added the language column to {}'.format(self.path))
+            connection.execute('DROP INDEX IF EXISTS entries_keyword')
+            connection.execute('CREATE INDEX IF NOT EXISTS entries_key ON entries (keyword, source, language)')
+            if connection.execute('PRAGMA user_version').fetchone()[0] < 1:
+                # add_cached once read the page urls the cache was keyed by as keywords
+                connection.execute("DELETE FROM entries WHERE keyword LIKE 'http://%' OR keyword LIKE 'https://%'")
+                connection.execute('PRAGMA user_version = 1')
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def cambridge_rows(entries):
+        for entry in entries:
+            for define in entry['defines']:
+                senses = [(define, 'define', None)] + [(phrase, 'phrase', phrase.get('phrase')) for phrase in define['phrases']]
+                for sense, kind, phrase in senses:
+                    grammar = sense.get('grammar', entry.get('grammar'))
+                    headword = phrase or entry['text']
+                    yield headword, entry['pos'], grammar, kind, sense['define']['text'], sense['define']['translate']
+                    for example in sense['examples']:
+                        yield headword, entry['pos'], grammar, 'example', example['text'], example['translate']
+
+    @staticmethod
+    def merriam_rows(keyword, data):
+        for kind in ('first_known_use', 'etymology'):
+            for item in data.get(kind, []):
+                yield keyword, item['type'], None, kind, item['text'], None
+
+    def rows(self, source, keyword, data):
+        if source == 'Cambridge':
+            return self.cambridge_rows(data)
+        if source == 'Merriam':
+            return self.merriam_rows(keyword, data)
+        if data.get('text'):
+            return [(keyword, None, None, 'etymology', data['text'], None)]
+        return []
+
+    def add(self, source, language, keyword, data):
+        keyword  = ' '.join(keyword.lower().split())
+        language = language or ''
+        with self.connection as connection:
+            connection.execute('DELETE FROM entries WHERE keyword = ? AND source = ? AND language = ?', (keyword, source, language))
+            connection.executemany(
+                'INSERT INTO entries (keyword, source, language, headword, pos, grammar, kind, text, translate) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((keyword, source, language) + row for row in self.rows(source, keyword, data) if row[4])
+            )
+
+    def add_cached(self, cache):
+        # backfill from entries that were cached before the index existed
+        count = 0
+        for source, language, keyword, data in cache.connection.execute('SELECT source, language, keyword, data FROM parsed').fetchall():
+            self.add(source, language, keyword, json.loads(zlib.decompress(data)))
+            count += 1
+        return count
+
+    @staticmethod
+    def match_expression(text, prefix):
+        # quote every token so user input never reaches the fts5 query syntax
+        tokens = re.findall(r'\w+', text)
+        return ' '.join('"{}"{}'.format(token, '*' if prefix else '') for token in tokens)
+
+    def search(self, text, pos=None, grammar=None, kinds=None, sources=None, prefix=False, limit=20):
+        expression = self.match_expression(text, prefix)
+        if not expression:
+            return []
+        query = '''
+            SELECT e.keyword, e.source, e.language, e.headword, e.pos, e.grammar, e.kind, e.text, e.translate, bm25(entries_fts, 5.0, 1.0, 1.0) AS score
+            FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid
+            WHERE entries_fts MATCH ?
+        '''
+        params = [expression]
+        for column, values in (('pos', pos), ('grammar', grammar), ('kind', kinds), ('source', sources)):
+            if values:
+                values = [values] if isinstance(values, str) else list(values)
+                query += ' AND e.{} IN ({})'.format(column, ', '.join('?' * len(values)))
+                params += values
+        query += ' ORDER BY score LIMIT ?'
+        params.append(limit)
+        return [dict(row) for row in self.connection.execute(query, params)]
+
+    def words(self, prefix, limit=20):
+        rows = self.connection.execute(
+            'SELECT DISTINCT headword FROM entries WHERE headword LIKE ? ESCAPE ? ORDER BY headword COLLATE NOCASE LIMIT ?',
+            (prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%', '\\', limit)
+        )
+        return [row['headword'] for row in rows]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = Index(os.path.join(cache_dir(), 'index.sqlite'))
+        return _index
+
+
+def ingest(source, language, keyword, data):
+    if os.environ.get('ENGLIPEDIA_INDEX', '1') != '0':
+        try:
+            get_index().add(source, language, keyword, data)
+        except sqlite3.Error as error:
+            logging.warning('Could not index "{}" from {}: {}'.format(keyword, source, error))
+    return data
@@ -0,0 +1,226 @@
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+
+from collections import Counter
+from urllib.parse import quote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .bench import BENCH_DIR
+from .metrics import percentile
+
+
+SYNTHETIC = {
+    'Cambridge': '<html><body><div class="pr entry-body__el"><div class="pos-header dpos-h">'
+                 '<span class="hw dhw">{word}</span><span class="pos dpos">noun</span></div><div class="pos-body">'
+                 '<div class="def-block ddef_block"><div class="ddef_h"><div class="def ddef_d db">a thing called {word}</div></div>'
+                 '<div class="def-body ddef_b"><div class="examp dexamp"><span class="eg deg">the {word} is here</span></div></div>'
+                 '</div></div></div>{padding}</body></html>',
+    'Merriam': '<html><body><div id="etymology-anchor"><p class="et">from {word}</p></div>'
+               '<div id="first-known-anchor"><p class="ety-sl">1590</p></div>{padding}</body></html>',
+    'Etymology': '<html><body><section class="word__defination--2q7ZH"><p>{word}, from Old English</p></section>'
+                 '{padding}</body></html>'
+}
+
+
+class Upstream:
+
+    # stand-in for the three dictionary sites: serves recorded bench fixtures
+    # when there are any, synthetic pages otherwise, and counts every hit
+    def __init__(self, delay=0.05, padding=50000):
+        self.delay   = delay
+        self.padding = '<p>{}</p>'.format('x' * padding)
+        self.hits    = Counter()
+        self._lock   = threading.Lock()
+
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                _, source, word = self.path.split('/', 2)
+                with upstream._lock:
+                    upstream.hits[source] += 1
+                time.sleep(upstream.delay)
+                page = upstream.page(source, word)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def page(self, source, word):
+        path = os.path.join(BENCH_DIR, 'fixtures', source, word + '.html.gz')
+        if os.path.exists(path):
+            with gzip.open(path, 'rb') as fp:
+                return fp.read()
+        return SYNTHETIC[source].format(word=word, padding=self.padding).encode('utf-8')
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_service(upstream, port, rate, max_workers, cache_dir):
+    env = dict(os.environ,
+               ENGLIPEDIA_CACHE_DIR=cache_dir,
+               ENGLIPEDIA_SNAPSHOT=os.path.join(cache_dir, 'no-snapshot'),
+               ENGLIPEDIA_INDEX='0',
+               ENGLIPEDIA_MEDIA='0')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, '-m', __package__ + '.service', '--port', str(port), '--upstream', upstream, '--rate', str(rate), '--max-workers', str(max_workers)]
+    process = subprocess.Popen(command, cwd=root, env=env, stdout=subprocess.DEVNULL)
+    started = time.perf_counter()
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return process, time.perf_counter() - started
+        except OSError:
+            if process.poll() is not None or time.perf_counter() - started > 30:
+                raise RuntimeError('The lookup service did not start')
+            time.sleep(0.01)
+
+
+class Connection:
+
+    def __init__(self, port):
+        self.port   = port
+        self.reader = None
+        self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.writer.write('GET {} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'.format(path).encode('latin-1'))
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        body = await self.reader.readexactly(length)
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def burst(port, word, clients):
+    # every client asks for the same word at once
+    connections = [Connection(port) for _ in range(clients)]
+    responses = await asyncio.gather(*[connection.get('/lookup?q=' + quote(word)) for connection in connections])
+    for connection in connections:
+        connection.close()
+    return [status for status, _ in responses]
+
+
+async def load(port, words, requests, concurrency):
+    latencies, statuses, errors = [], Counter(), Counter()
+    queue = iter(range(requests))
+
+    async def client():
+        connection = Connection(port)
+        for _ in queue:
+            start = time.perf_counter()
+            status, body = await connection.get('/lookup?q=' + quote(random.choice(words)))
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+            if status == 200:
+                errors.update(json.loads(body)['errors'])
+        connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return latencies, statuses, errors, time.perf_counter() - started
+
+
+def run(words, requests, concurrency, clients, delay, rate, max_workers):
+    upstream = Upstream(delay).start()
+    port = free_port()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        process, startup = start_service(upstream.url, port, rate, max_workers, cache_dir)
+        try:
+            report = {'startup_seconds': round(startup, 3)}
+
+            statuses = asyncio.run(burst(port, words[0], clients))
+            report['coalesce'] = {
+                'clients': clients,
+                'ok': statuses.count(200),
+                'upstream_fetches': dict(upstream.hits)
+            }
+
+            upstream.hits.clear()
+            latencies, statuses, errors, elapsed = asyncio.run(load(port, words, requests, concurrency))
+            report['load'] = {
+                'requests': len(latencies),
+                'concurrency': concurrency,
+                'words': len(words),
+                'statuses': dict(statuses),
+                'lookup_errors': dict(errors),
+                'requests_per_second': round(len(latencies) / elapsed, 1),
+                'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+                'p90_ms': round(percentile(latencies, 0.9) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+                'max_ms': round(max(latencies) * 1000, 2),
+                'upstream_fetches': dict(upstream.hits)
+            }
+        finally:
+            process.terminate()
+            process.wait()
+            upstream.stop()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the lookup service against a local stand-in upstream')
+    parser.add_argument('--corpus', default=os.path.join(BENCH_DIR, 'corpus.json'), help='json of word lists, or a file with one word per line')
+    parser.add_argument('-n', '--requests', type=int, default=2000)
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('--clients', type=int, default=50, help='clients asking for the same word in the coalescing burst')
+    parser.add_argument('--delay', type=float, default=0.05, help='seconds the stand-in upstream takes per page')
+    parser.add_argument('--rate', type=float, default=1000.0, help='requests per second the service may send upstream')
+    parser.add_argument('--max-workers', type=int, default=16)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.corpus, encoding='utf-8') as fp:
+        if args.corpus.endswith('.json'):
+            words = [word for group in json.load(fp).values() for word in group]
+        else:
+            words = [line.strip() for line in fp if line.strip()]
+    print(json.dumps(run(words, args.requests, args.concurrency, args.clients, args.delay, args.rate, args.max_workers), indent=2))
+
+
+if __name__ == '__main__':
+    main()
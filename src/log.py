@@ -1,7 +1,16 @@
 import os
+import json
 import logging.config
 
 
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        event = {'time': record.created, 'logger': record.name, 'level': record.levelname}
+        event.update(getattr(record, 'event', {'message': record.getMessage()}))
+        return json.dumps(event, ensure_ascii=False)
+
+
 LOGGING_CONFIG = {
     'version': 1,
     'disable_existing_loggers': True,
@@ -9,6 +18,9 @@ LOGGING_CONFIG = {
         'standard': {
             'format': '%(asctime)s [%(levelname)s] [%(name)s]: %(message)s'
         },
+        'json': {
+            '()': JsonFormatter
+        },
     },
     'handlers': {
         'default': {
@@ -16,6 +28,15 @@ LOGGING_CONFIG = {
             'formatter': 'standard',
             'class': 'logging.StreamHandler',
             'stream': 'ext://sys.stdout',  # Default is stderr
+        },
+        # one JSON object per timer/histogram event, only when a path is given
+        'metrics': {
+            'level': 'DEBUG',
+            'formatter': 'json',
+            'class': 'logging.FileHandler',
+            'filename': os.environ['ENGLIPEDIA_METRICS_LOG']
+        } if os.environ.get('ENGLIPEDIA_METRICS_LOG') else {
+            'class': 'logging.NullHandler'
         }
     },
     'loggers': {
@@ -23,6 +44,11 @@ LOGGING_CONFIG = {
             'handlers': ['default'],
             'level': 'DEBUG',
             'propagate': False
+        },
+        'englipedia.metrics': {
+            'handlers': ['metrics'],
+            'level': 'DEBUG' if os.environ.get('ENGLIPEDIA_METRICS_LOG') else 'INFO',
+            'propagate': False
         }
     }
 }
@@ -0,0 +1,181 @@
+import io
+import os
+import logging
+import hashlib
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from . import metrics
+from .cache import cache_dir
+from .client import get_client
+from .schedule import current_lane, lane
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class MediaStore:
+
+    # images are stored once under the hash of their bytes; a url only points
+    # at a hash, so charts shared by several words take the space once
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, max_workers=4):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.executor  = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='media')
+        self._lock     = threading.Lock()
+        self._pending  = {}
+        self._size     = None
+
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'urls'), exist_ok=True)
+
+    def object_path(self, name):
+        return os.path.join(self.directory, 'objects', name[:2], name)
+
+    def url_path(self, url):
+        return os.path.join(self.directory, 'urls', digest(url.encode('utf-8')))
+
+    @staticmethod
+    def write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as fp:
+            fp.write(data)
+        os.replace(path + '.tmp', path)
+
+    def read(self, name):
+        path = self.object_path(name)
+        try:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+        except FileNotFoundError:
+            return None
+        # mtime doubles as the last access for eviction
+        os.utime(path)
+        return data
+
+    def lookup(self, url):
+        try:
+            with open(self.url_path(url)) as fp:
+                return fp.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def store(self, url, data):
+        name = digest(data)
+        path = self.object_path(name)
+        if not os.path.exists(path):
+            self.write(path, data)
+            self.grow(len(data))
+        self.write(self.url_path(url), name.encode('ascii'))
+        return name
+
+    def get(self, url, size=None, timeout=None):
+        # local bytes only: waits up to timeout for a download already running,
+        # never starts one itself
+        if timeout:
+            with self._lock:
+                future = self._pending.get(url)
+            if future is not None:
+                wait([future], timeout)
+        name = self.lookup(url)
+        data = self.read(name) if name else None
+        metrics.inc('media', result='miss' if data is None else 'hit')
+        if data is not None and size:
+            return self.thumbnail(name, data, size)
+        return data
+
+    def pending(self, url):
+        with self._lock:
+            return self._pending.get(url)
+
+    def prefetch(self, url, priority=None):
+        if not url:
+            return None
+        with self._lock:
+            future = self._pending.get(url)
+            if future is None:
+                name = self.lookup(url)
+                if name and os.path.exists(self.object_path(name)):
+                    return None
+                # the download waits for its host in the lane of whoever asked for it
+                priority = current_lane() if priority is None else priority
+                future = self._pending[url] = self.executor.submit(self.download, url, priority)
+        return future
+
+    def download(self, url, priority):
+        try:
+            with lane(priority), metrics.timer('media_seconds'):
+                response = get_client().get(url)
+                response.raise_for_status()
+            metrics.observe('media_bytes', len(response.content))
+            return self.store(url, response.content)
+        except Exception as e:
+            logging.warning('Failed to download image {}: {}'.format(url, e))
+            metrics.inc('media_errors')
+        finally:
+            with self._lock:
+                self._pending.pop(url, None)
+
+    def thumbnail(self, name, data, size):
+        # thumbnails are derived objects keyed by the source hash and the size
+        if Image is None:
+            return data
+        thumb_name = '{}-{}'.format(name, size)
+        thumb = self.read(thumb_name)
+        if thumb is None:
+            image = Image.open(io.BytesIO(data))
+            image.thumbnail((size, size))
+            buffer = io.BytesIO()
+            image.save(buffer, format='PNG', optimize=True)
+            thumb = buffer.getvalue()
+            self.write(self.object_path(thumb_name), thumb)
+            self.grow(len(thumb))
+        return thumb
+
+    def objects(self):
+        root = os.path.join(self.directory, 'objects')
+        for prefix in os.listdir(root):
+            for name in os.listdir(os.path.join(root, prefix)):
+                if not name.endswith('.tmp'):
+                    path = os.path.join(root, prefix, name)
+                    stat = os.stat(path)
+                    yield stat.st_mtime, stat.st_size, path
+
+    def grow(self, size):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self.objects())
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        # least recently read objects go first; urls pointing at them become misses
+        for _, size, path in sorted(self.objects()):
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._size -= size
+            metrics.inc('media_evictions')
+
+
+_media = None
+_media_lock = threading.Lock()
+
+
+def get_media():
+    global _media
+    with _media_lock:
+        if _media is None:
+            _media = MediaStore(os.path.join(cache_dir(), 'media'), max_bytes=int(os.environ.get('ENGLIPEDIA_MEDIA_BYTES', 64 * 1024 * 1024)))
+        return _media
@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+import threading
+
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+PREFIX = 'englipedia_'
+
+BUCKETS = {
+    'seconds': (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+    'bytes': (1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+    'count': (0, 1, 2, 5, 10, 20, 50, 100, 200)
+}
+
+logger = logging.getLogger('englipedia.metrics')
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(ratio * (len(values) - 1))))]
+
+
+class Histogram:
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum    = 0.0
+        self.count  = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum   += value
+        self.count += 1
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock       = threading.Lock()
+        self._counters   = {}
+        self._histograms = {}
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(BUCKETS.get(name.rsplit('_', 1)[-1], BUCKETS['count']))
+            histogram.observe(value)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(name, extra={'event': dict(labels, metric=name, value=value)})
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def stats(self):
+        with self._lock:
+            counters   = dict(self._counters)
+            histograms = {key: (h.bounds, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+        result = {'counters': {}, 'histograms': {}}
+        for (name, labels), value in counters.items():
+            result['counters'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), (bounds, counts, total, count) in histograms.items():
+            result['histograms'].setdefault(name, []).append({
+                'labels': dict(labels),
+                'count': count,
+                'sum': total,
+                'mean': total / count if count else 0.0,
+                'buckets': dict(zip([str(b) for b in bounds] + ['+Inf'], counts))
+            })
+        return result
+
+    @staticmethod
+    def format_labels(labels, **extra):
+        pairs = list(labels) + list(extra.items())
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs) + '}'
+
+    def prometheus(self):
+        with self._lock:
+            counters   = sorted(self._counters.items())
+            histograms = sorted((key, (h.bounds, list(h.counts), h.sum, h.count)) for key, h in self._histograms.items())
+        lines, typed = [], set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {}{}_total counter'.format(PREFIX, name))
+            lines.append('{}{}_total{} {}'.format(PREFIX, name, self.format_labels(labels), value))
+        for (name, labels), (bounds, counts, total, count) in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {}{} histogram'.format(PREFIX, name))
+            cumulative = 0
+            for bound, bucket in zip(list(bounds) + ['+Inf'], counts):
+                cumulative += bucket
+                lines.append('{}{}_bucket{} {}'.format(PREFIX, name, self.format_labels(labels, le=bound), cumulative))
+            lines.append('{}{}_sum{} {}'.format(PREFIX, name, self.format_labels(labels), total))
+            lines.append('{}{}_count{} {}'.format(PREFIX, name, self.format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        with open(path + '.tmp', 'w') as fp:
+            fp.write(self.prometheus())
+        os.replace(path + '.tmp', path)
+
+
+registry = Registry()
+
+inc              = registry.inc
+observe          = registry.observe
+timer            = registry.timer
+stats            = registry.stats
+prometheus       = registry.prometheus
+write_prometheus = registry.write_prometheus
@@ -0,0 +1,170 @@
+import sys
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+NO_TRANSLATION = sys.intern('無翻譯')
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Record:
+
+    # slots based records that still read like the plain dicts they replace;
+    # optional fields left as None are absent from the mapping view
+    __slots__ = ()
+    fields    = ()
+    optional  = ()
+
+    def __getitem__(self, key):
+        if key not in self.fields:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None and key in self.optional:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [key for key in self.fields if key not in self.optional or getattr(self, key) is not None]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return to_dict(self) == to_dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join('{}={!r}'.format(key, value) for key, value in self.items()))
+
+    def to_dict(self):
+        return {key: to_dict(value) for key, value in self.items()}
+
+
+class Text(Record):
+
+    __slots__ = ('text', 'translate')
+    fields    = __slots__
+
+    def __init__(self, text, translate=NO_TRANSLATION):
+        self.text      = text
+        self.translate = NO_TRANSLATION if translate == NO_TRANSLATION else translate
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['text'], data['translate'])
+
+
+class Sense(Record):
+
+    __slots__ = ('define', 'examples', 'phrases', 'grammar', 'phrase')
+    fields    = __slots__
+    optional  = ('grammar', 'phrase')
+
+    def __init__(self, define, examples=(), phrases=(), grammar=None, phrase=None):
+        self.define   = define
+        self.examples = list(examples)
+        self.phrases  = list(phrases)
+        self.grammar  = intern(grammar)
+        self.phrase   = phrase
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            Text.from_dict(data['define']),
+            [Text.from_dict(example) for example in data['examples']],
+            [cls.from_dict(phrase) for phrase in data['phrases']],
+            data.get('grammar'),
+            data.get('phrase')
+        )
+
+
+class Entry(Record):
+
+    __slots__ = ('text', 'pos', 'grammar', 'defines')
+    fields    = __slots__
+    optional  = ('grammar',)
+
+    def __init__(self, text, pos=None, grammar=None, defines=()):
+        self.text    = text
+        self.pos     = intern(pos)
+        self.grammar = intern(grammar)
+        self.defines = list(defines)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['text'], data['pos'], data.get('grammar'), [Sense.from_dict(define) for define in data['defines']])
+
+
+def to_dict(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {key: to_dict(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_dict(item) for item in value]
+    return value
+
+
+def entries_from_dicts(data):
+    return [Entry.from_dict(entry) for entry in data]
+
+
+def encode(value):
+    # json.dumps(..., default=encode) for anything holding records
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+def to_record(keyword, result):
+    # response shape of a lookup over several sources, failures as strings
+    record = {'keyword': keyword, 'results': {}, 'errors': {}}
+    for dict_name, data in result.items():
+        if isinstance(data, Exception):
+            record['errors'][dict_name] = '{}: {}'.format(type(data).__name__, data)
+        else:
+            record['results'][dict_name] = data
+    return record
+
+
+def dumps(entries):
+    return json.dumps(entries, ensure_ascii=False, default=encode)
+
+
+def loads(data):
+    return entries_from_dicts(json.loads(data))
+
+
+def packb(entries):
+    if msgpack is None:
+        raise RuntimeError('msgpack is not installed')
+    return msgpack.packb(entries, default=encode, use_bin_type=True)
+
+
+def unpackb(data):
+    if msgpack is None:
+        raise RuntimeError('msgpack is not installed')
+    return entries_from_dicts(msgpack.unpackb(data, raw=False))
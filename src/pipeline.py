@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+from . import metrics
+from .model import dumps, entries_from_dicts
+
+
+_engines = {}
+
+
+def worker_engine(source, language):
+    # every worker process builds each dictionary once and keeps it
+    key = (source, language)
+    if key not in _engines:
+        from . import dict as dictionary
+        if source == 'Cambridge':
+            _engines[key] = dictionary.CamBridge(language)
+        elif source == 'Merriam':
+            _engines[key] = dictionary.MerriamWebster()
+        else:
+            _engines[key] = dictionary.OnlineEtymology()
+    return _engines[key]
+
+
+def parse_page(source, language, page):
+    # records go back as one json string, much cheaper to pickle than the objects
+    return dumps(worker_engine(source, language).parse(page))
+
+
+class Pending:
+
+    # a page handed to the process pool; result() waits for the parse and then
+    # runs, once, the steps the lookup thread would have run right after it
+    def __init__(self, future, decode=None):
+        self.future    = future
+        self.decode    = decode
+        self.finishers = []
+        self._lock     = threading.Lock()
+        self._done     = False
+        self._data     = None
+
+    def then(self, finish):
+        self.finishers.append(finish)
+        return self
+
+    def result(self, timeout=None):
+        payload = self.future.result(timeout)
+        with self._lock:
+            if not self._done:
+                data = json.loads(payload)
+                if self.decode:
+                    data = self.decode(data)
+                for finish in self.finishers:
+                    finish(data)
+                self._data, self._done = data, True
+        return self._data
+
+
+class ProcessParser:
+
+    # second pipeline stage: fetch threads hand raw pages to a process pool and
+    # go back to fetching; they only block once `backlog` pages are waiting for
+    # the pool, so downloads cannot outrun parsing
+    def __init__(self, workers=None, backlog=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool    = ProcessPoolExecutor(max_workers=self.workers)
+        self.slots   = threading.BoundedSemaphore(backlog or 2 * self.workers)
+
+    def submit(self, source, language, page):
+        self.slots.acquire()
+        start = time.perf_counter()
+        try:
+            future = self.pool.submit(parse_page, source, language, page)
+        except BaseException:
+            self.slots.release()
+            raise
+
+        def done(_):
+            self.slots.release()
+            metrics.observe('parse_seconds', time.perf_counter() - start, source=source)
+
+        future.add_done_callback(done)
+        return Pending(future, entries_from_dicts if source == 'Cambridge' else None)
+
+    def close(self):
+        self.pool.shutdown()
@@ -0,0 +1,26 @@
+def normalize(keyword):
+    return ' '.join(keyword.split()).lower()
+
+
+class Plan:
+
+    # collapse the keyword list to one lookup per normalized keyword and fan
+    # the results back out to every line that asked for it
+    def __init__(self, keywords):
+        self.requests = []
+        self.keywords = []
+        seen = set()
+        for keyword in keywords:
+            normalized = normalize(keyword)
+            if not normalized:
+                continue
+            self.requests.append((keyword.strip(), normalized))
+            if normalized not in seen:
+                seen.add(normalized)
+                self.keywords.append(normalized)
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def fan_out(self, results):
+        return {keyword: results[normalized] for keyword, normalized in self.requests if normalized in results}
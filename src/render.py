@@ -0,0 +1,131 @@
+import io
+
+from . import metrics
+from .util import myprint
+
+
+class ImageRef:
+
+    __slots__ = ('url',)
+
+    def __init__(self, url):
+        self.url = url
+
+
+def freeze(field):
+    return tuple(sorted(field.items()))
+
+
+class Renderer:
+
+    def __init__(self):
+        self.fragments = {}
+
+    def clear(self):
+        self.fragments.clear()
+
+    def fragment(self, key, build, *args):
+        # every section is formatted once per distinct set of fields it reads
+        chunks = self.fragments.get(key)
+        if chunks is None:
+            chunks = self.fragments[key] = build(*args)
+        return chunks
+
+    def render(self, results, fields):
+        word_field    = fields['Cambridge']['word']
+        phrase_field  = fields['Cambridge']['phrase']
+        translate     = fields['translate']['requirment']
+        cambridge_key = (freeze(word_field), freeze(phrase_field), translate)
+
+        for keyword, result in results.items():
+            yield '{}:\n{}\n'.format(keyword, '*' * 10)
+            yield from self.fragment((keyword, 'Cambridge', cambridge_key), self.cambridge, result.get('Cambridge', []), word_field, phrase_field, translate)
+            yield from self.fragment((keyword, 'Merriam', freeze(fields['Merriam'])), self.merriam, result.get('Merriam'), fields['Merriam'])
+            yield from self.fragment((keyword, 'Etymology', freeze(fields['Etymology'])), self.etymology, result.get('Etymology'), fields['Etymology'])
+            yield '=' * 75 + '\n'
+
+    def write(self, results, fields, file, show_image=None):
+        # consecutive text is written in one go, images are handed to show_image
+        with metrics.timer('render_seconds'):
+            self._write(results, fields, file, show_image)
+        metrics.observe('rendered_keywords', len(results))
+
+    def _write(self, results, fields, file, show_image):
+        buffer = []
+        for chunk in self.render(results, fields):
+            if isinstance(chunk, ImageRef):
+                file.write(''.join(buffer))
+                buffer = []
+                if show_image:
+                    show_image(chunk.url)
+            else:
+                buffer.append(chunk)
+        file.write(''.join(buffer))
+
+    def cambridge(self, words, word_field, phrase_field, translate):
+        file = io.StringIO()
+        for word in words:
+            myprint(word['text'], head=4, file=file)
+            myprint('(part-of-speech: {})'.format(word['pos']) if word_field['pos'] else '', end='\n', file=file)
+
+            defines = word['defines'] if word_field['define'] else []
+            for idx, define in enumerate(defines):
+                grammar = define.get('grammar', word.get('grammar', None))
+                myprint('define {}: {}'.format(idx, define['define']['text']), head=8, file=file)
+                myprint('({})'.format(define['define']['translate']) if translate and define['define']['text'] else '', head=1, file=file)
+                myprint('[{}]'.format(grammar) if word_field['grammar'] else '', end='\n', head=1, file=file)
+
+                examples = define['examples'] if word_field['examples'] else []
+                for ex_idx, example in enumerate(examples):
+                    myprint('- example {}: {}'.format(ex_idx, example['text']), head=12, file=file)
+                    myprint('({})'.format(example['translate']) if translate and example['text'] else '', end='\n', head=1, file=file)
+
+                phrases = define['phrases'] if phrase_field['text'] else []
+                for ph_idx, phrase in enumerate(phrases):
+                    myprint('* phrase {}: {}'.format(ph_idx, phrase['phrase']), head=12, end='\n', file=file)
+                    myprint('define: {}'.format(phrase['define']['text'] if phrase_field['define'] else ''), head=16, file=file)
+                    myprint('({})'.format(phrase['define']['translate']) if translate and phrase_field['define'] else '', end='\n', head=1, file=file)
+
+                    examples = phrase['examples'] if phrase_field['examples'] else []
+                    for ex_idx, example in enumerate(examples):
+                        myprint('- example {}: {}'.format(ex_idx, example['text']), head=20, file=file)
+                        myprint('({})'.format(example['translate'] if translate and example['text'] else ''), end='\n', head=1, file=file)
+            myprint(end='\n', file=file)
+        return [file.getvalue()]
+
+    def merriam(self, data, merriam_field):
+        file = io.StringIO()
+        if data and (merriam_field['first use'] or merriam_field['etymology']):
+            myprint('In Merriam webster:', end='\n', head=4, file=file)
+            if merriam_field['first use']:
+                myprint('First known use:', head=8, end='\n', file=file)
+                self.print_merriam(data['first_known_use'], file=file)
+
+            if merriam_field['etymology']:
+                myprint('Etymology:', head=8, end='\n', file=file)
+                self.print_merriam(data['etymology'], file=file)
+        return [file.getvalue()]
+
+    def print_merriam(self, data, file):
+        if data:
+            for d in data:
+                if d['type']:
+                    myprint('part-of-speech: {}'.format(d['type']), head=12, end='\n', file=file)
+                myprint(d['text'], head=12, end='\n', file=file)
+                myprint(file=file)
+        else:
+            myprint(data if data else 'No data', head=8, end='\n', file=file)
+
+    def etymology(self, data, etymology_field):
+        file = io.StringIO()
+        chunks = []
+        if data and (etymology_field['description'] or etymology_field['image(if any)']):
+            myprint('In etymology online:', end='\n', head=4, file=file)
+            if etymology_field['description']:
+                myprint('Description:', head=8, end='\n', file=file)
+                myprint(data['text'] if data['text'] else 'No data', head=12, end='\n', file=file)
+            if etymology_field['image(if any)'] and data['image_url']:
+                chunks += [file.getvalue(), ImageRef(data['image_url'])]
+                file = io.StringIO()
+                myprint(end='\n', file=file)
+        return chunks + [file.getvalue()]
@@ -0,0 +1,130 @@
+import time
+import heapq
+import logging
+import threading
+import itertools
+
+from contextlib import contextmanager
+
+
+# lanes only order requests inside one process, through the shared client of
+# client.get_client(); a batch started with python -m src.batch has its own
+# limiter, so run batch.run() in a thread of the kernel to have it yield to the UI
+INTERACTIVE = 0
+BACKGROUND  = 1
+
+_lane = threading.local()
+
+
+def current_lane():
+    return getattr(_lane, 'priority', INTERACTIVE)
+
+
+@contextmanager
+def lane(priority):
+    previous = current_lane()
+    _lane.priority = priority
+    try:
+        yield
+    finally:
+        _lane.priority = previous
+
+
+class HostBucket:
+
+    # token bucket whose rate backs off multiplicatively on throttling and
+    # recovers additively while responses are fine
+    def __init__(self, rate, burst, min_rate, max_rate):
+        self.rate     = rate
+        self.burst    = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens   = burst
+        self.updated  = time.monotonic()
+        self.paused_until = 0.0
+        self.throttles    = 0
+        self.granted      = 0
+        self.waiters   = []
+        self.condition = threading.Condition()
+
+    def refill(self, now):
+        self.tokens  = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        if now < self.paused_until:
+            return self.paused_until - now
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class Scheduler:
+
+    default_rates = {
+        'dictionary.cambridge.org': 5.0,
+        'www.merriam-webster.com': 5.0,
+        'www.etymonline.com': 3.0
+    }
+
+    def __init__(self, rates=None, default_rate=4.0, burst=4, min_rate=0.2, max_rate=20.0, increase=0.1):
+        self.rates        = dict(self.default_rates, **(rates or {}))
+        self.default_rate = default_rate
+        self.burst        = burst
+        self.min_rate     = min_rate
+        self.max_rate     = max_rate
+        self.increase     = increase
+        self._buckets = {}
+        self._lock    = threading.Lock()
+        self._order   = itertools.count()
+
+    def bucket(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = HostBucket(self.rates.get(host, self.default_rate), self.burst, self.min_rate, self.max_rate)
+            return self._buckets[host]
+
+    def acquire(self, host, priority=None):
+        # a request only takes a token once every waiter in a better lane (or
+        # earlier in the same lane) for that host has been served
+        bucket = self.bucket(host)
+        ticket = (current_lane() if priority is None else priority, next(self._order))
+        with bucket.condition:
+            heapq.heappush(bucket.waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    bucket.refill(now)
+                    if bucket.waiters[0] == ticket and now >= bucket.paused_until and bucket.tokens >= 1:
+                        heapq.heappop(bucket.waiters)
+                        bucket.tokens  -= 1
+                        bucket.granted += 1
+                        bucket.condition.notify_all()
+                        return
+                    bucket.condition.wait(bucket.wait_time(now) if bucket.waiters[0] == ticket else None)
+            except BaseException:
+                # an interrupted waiter must not stay at the head and stall the host
+                bucket.waiters.remove(ticket)
+                heapq.heapify(bucket.waiters)
+                bucket.condition.notify_all()
+                raise
+
+    def throttled(self, host, delay):
+        bucket = self.bucket(host)
+        with bucket.condition:
+            bucket.rate = max(bucket.min_rate, bucket.rate / 2)
+            bucket.paused_until = max(bucket.paused_until, time.monotonic() + delay)
+            bucket.throttles += 1
+            bucket.condition.notify_all()
+        logging.warning('{} is throttling, pause {:.1f}s and slow down to {:.2f} req/s'.format(host, delay, bucket.rate))
+
+    def succeeded(self, host):
+        bucket = self.bucket(host)
+        with bucket.condition:
+            bucket.rate = min(bucket.max_rate, bucket.rate + self.increase)
+
+    def stats(self):
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {
+            host: {'rate': bucket.rate, 'granted': bucket.granted, 'throttles': bucket.throttles, 'waiting': len(bucket.waiters)}
+            for host, bucket in buckets.items()
+        }
@@ -0,0 +1,182 @@
+import json
+import time
+import asyncio
+import logging
+import argparse
+
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from . import metrics
+from .plan import normalize
+from .model import encode, to_record
+
+# the dictionaries (and with them bs4, lxml and sqlite) load on the first
+# lookup so the service starts fast; everything above is standard library only
+
+SOURCES = ('Cambridge', 'Merriam', 'Etymology')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class SingleFlight:
+
+    # concurrent calls with the same key share one running call and its result
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, call):
+        future = self.calls.get(key)
+        if future is None:
+            future = self.calls[key] = asyncio.ensure_future(call())
+            future.add_done_callback(lambda _: self.calls.pop(key, None))
+        else:
+            metrics.inc('coalesced', source=key[0])
+        # a client going away must not cancel the call the others are waiting on
+        return await asyncio.shield(future)
+
+
+class LookupService:
+
+    def __init__(self, max_workers=16, upstream=None):
+        self.max_workers = max_workers
+        self.upstream    = upstream
+        self.flights     = SingleFlight()
+        self._engines    = {}
+        self._executor   = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='lookup')
+        return self._executor
+
+    def engines(self, translate):
+        if translate not in self._engines:
+            from .engine import create_engines
+            engines = create_engines(translate)
+            if self.upstream:
+                for name, engine in engines.items():
+                    engine.prefix_url = '{}/{}/'.format(self.upstream.rstrip('/'), name)
+            self._engines[translate] = engines
+        return self._engines[translate]
+
+    async def lookup(self, keyword, sources, translate=False):
+        keyword = normalize(keyword)
+        engines = self.engines(translate)
+        loop    = asyncio.get_running_loop()
+
+        async def search(name):
+            key = (name, getattr(engines[name], 'language', None), keyword)
+            try:
+                return await self.flights.do(key, lambda: loop.run_in_executor(self.executor, engines[name].search, keyword))
+            except Exception as e:
+                return e
+
+        results = await asyncio.gather(*[search(name) for name in sources])
+        return to_record(keyword, dict(zip(sources, results)))
+
+    async def route(self, method, target):
+        url   = urlsplit(target)
+        query = parse_qs(url.query)
+        if method != 'GET':
+            return 405, {'error': 'only GET is supported'}
+        if url.path == '/health':
+            return 200, {'status': 'ok'}
+        if url.path == '/metrics':
+            return 200, metrics.prometheus()
+        if url.path == '/lookup':
+            keyword = query.get('q', [''])[0].strip()
+            if not keyword:
+                return 400, {'error': 'the q parameter is required'}
+            sources = [name for value in query.get('sources', [','.join(SOURCES)]) for name in value.split(',') if name]
+            unknown = [name for name in sources if name not in SOURCES]
+            if unknown:
+                return 400, {'error': 'unknown sources {}, expected some of {}'.format(', '.join(unknown), ', '.join(SOURCES))}
+            translate = query.get('translate', ['0'])[0] not in ('', '0', 'false')
+            return 200, await self.lookup(keyword, sources, translate)
+        return 404, {'error': 'no route for {}'.format(url.path)}
+
+    @staticmethod
+    def response(status, body, keep_alive):
+        if isinstance(body, str):
+            payload, content_type = body.encode('utf-8'), 'text/plain; version=0.0.4'
+        else:
+            payload, content_type = json.dumps(body, ensure_ascii=False, default=encode).encode('utf-8'), 'application/json'
+        head = 'HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+            status, REASONS[status], content_type, len(payload), 'keep-alive' if keep_alive else 'close')
+        return head.encode('latin-1') + payload
+
+    async def handle(self, reader, writer):
+        # minimal HTTP/1.1: GET requests without bodies, connections kept alive
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if len(parts) != 3:
+                    writer.write(self.response(400, {'error': 'malformed request line'}, False))
+                    break
+                method, target, version = parts
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                start = time.perf_counter()
+                try:
+                    status, body = await self.route(method, target)
+                except Exception as e:
+                    logging.exception('Failed to serve {}'.format(target))
+                    status, body = 500, {'error': '{}: {}'.format(type(e).__name__, e)}
+                writer.write(self.response(status, body, keep_alive))
+                await writer.drain()
+                self.observe(urlsplit(target).path, status, time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def observe(path, status, seconds):
+        metrics.inc('service_requests', path=path, status=status)
+        metrics.observe('service_seconds', seconds, path=path)
+
+    async def serve(self, host='127.0.0.1', port=8080, ready=None):
+        server = await asyncio.start_server(self.handle, host, port, limit=1 << 16)
+        logging.info('Serving lookups on {}'.format(', '.join('{}:{}'.format(*sock.getsockname()[:2]) for sock in server.sockets)))
+        if ready:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve dictionary lookups as JSON over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-workers', type=int, default=16, help='threads running dictionary searches')
+    parser.add_argument('--upstream', default=None, help='serve every source from <upstream>/<source>/<word> instead of the real sites')
+    parser.add_argument('--rate', type=float, default=None, help='requests per second allowed to every upstream host')
+    args = parser.parse_args(argv)
+
+    from . import log  # noqa: F401
+    if args.rate:
+        from .client import HttpClient, set_client
+        from .schedule import Scheduler
+        set_client(HttpClient(pool_size=args.max_workers, scheduler=Scheduler(rates=dict.fromkeys(Scheduler.default_rates, args.rate), default_rate=args.rate, burst=max(1, int(args.rate)), max_rate=args.rate)))
+    service = LookupService(args.max_workers, args.upstream)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import struct
+import logging
+import argparse
+import threading
+
+from .model import encode
+from .cache import cache_dir
+
+
+MAGIC  = b'ENGSNAP\x00'
+FORMAT = 1
+
+# magic, format, version, record count, offset of the key index
+HEADER = struct.Struct('<8sIQIQ')
+# offset of the key, length of the key, offset of the record
+SLOT   = struct.Struct('<QIQ')
+LENGTH = struct.Struct('<I')
+
+
+def snapshot_key(source, language, keyword):
+    # normalized like Cache.entry_key, so any casing of a word finds its record
+    return '\x00'.join((source, language or '', ' '.join(keyword.lower().split()))).encode('utf-8')
+
+
+class Snapshot:
+
+    # read-only view of a snapshot file; only the header is read up front, the
+    # sorted slot table is binary searched straight out of the mapping
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            self.inode = os.fstat(fp.fileno()).st_ino
+            self.mm    = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, self.version, self.count, self.index = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError('{} is not a format {} snapshot'.format(path, FORMAT))
+
+    def __len__(self):
+        return self.count
+
+    def key_at(self, position):
+        key_offset, key_size, record_offset = SLOT.unpack_from(self.mm, self.index + position * SLOT.size)
+        return self.mm[key_offset:key_offset + key_size], record_offset
+
+    def record_at(self, offset):
+        size, = LENGTH.unpack_from(self.mm, offset)
+        start = offset + LENGTH.size
+        return json.loads(zlib.decompress(self.mm[start:start + size]))
+
+    def get(self, source, language, keyword, decode=None):
+        key = snapshot_key(source, language, keyword)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            current, offset = self.key_at(middle)
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                data = self.record_at(offset)
+                return decode(data) if decode else data
+        return None
+
+    def keys(self):
+        for position in range(self.count):
+            source, language, keyword = self.key_at(position)[0].decode('utf-8').split('\x00')
+            yield source, language or None, keyword
+
+
+class SnapshotWriter:
+
+    # records are streamed to a temporary file as they are added, the sorted
+    # slot table goes after them and the file replaces `path` in one rename
+    def __init__(self, path, version=None, level=9):
+        self.path    = path
+        self.version = int(time.time()) if version is None else version
+        self.level   = level
+        self.records = {}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.fp      = open(path + '.tmp', 'wb')
+        self.fp.write(b'\x00' * HEADER.size)
+
+    def add(self, source, language, keyword, data):
+        body = zlib.compress(json.dumps(data, ensure_ascii=False, default=encode, separators=(',', ':')).encode('utf-8'), self.level)
+        self.records[snapshot_key(source, language, keyword)] = self.fp.tell()
+        self.fp.write(LENGTH.pack(len(body)))
+        self.fp.write(body)
+
+    def close(self):
+        keys = sorted(self.records)
+        key_offset = self.fp.tell() + len(keys) * SLOT.size
+        index = self.fp.tell()
+        for key in keys:
+            self.fp.write(SLOT.pack(key_offset, len(key), self.records[key]))
+            key_offset += len(key)
+        for key in keys:
+            self.fp.write(key)
+        self.fp.seek(0)
+        self.fp.write(HEADER.pack(MAGIC, FORMAT, self.version, len(keys), index))
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.fp.close()
+        os.replace(self.path + '.tmp', self.path)
+        return len(keys)
+
+    def abort(self):
+        self.fp.close()
+        os.remove(self.path + '.tmp')
+
+
+_snapshot = None
+_checked = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def snapshot_path():
+    return os.environ.get('ENGLIPEDIA_SNAPSHOT', os.path.join(cache_dir(), 'snapshot.bin'))
+
+
+def get_snapshot(recheck=5.0):
+    # a rebuilt snapshot is picked up within `recheck` seconds of the rename;
+    # readers of the old mapping keep it until they drop their reference
+    global _snapshot, _checked
+    now = time.monotonic()
+    if now - _checked < recheck:
+        return _snapshot
+    with _snapshot_lock:
+        if now - _checked >= recheck:
+            path = snapshot_path()
+            try:
+                inode = os.stat(path).st_ino
+            except OSError:
+                _snapshot = None
+            else:
+                if _snapshot is None or _snapshot.inode != inode:
+                    try:
+                        _snapshot = Snapshot(path)
+                        logging.info('Opened snapshot {} version {} with {} records'.format(path, _snapshot.version, len(_snapshot)))
+                    except (OSError, ValueError) as e:
+                        logging.warning('Ignore snapshot {}: {}'.format(path, e))
+                        _snapshot = None
+            _checked = now
+        return _snapshot
+
+
+def build(word_list, path, sources, translate=False, max_workers=16, per_host=4, window=64, version=None):
+    from .plan import normalize
+    from .dict import slug
+    from .engine import LookupEngine, create_engines
+    from .schedule import BACKGROUND
+
+    # rebuilds must see the sources, not the snapshot being replaced
+    engines = create_engines(translate, use_snapshot=False)
+    lookup  = LookupEngine(engines, max_workers=max_workers, per_host=per_host, priority=BACKGROUND)
+    with open(word_list, encoding='utf-8') as fp:
+        keywords = list(dict.fromkeys(keyword for keyword in map(normalize, fp) if keyword))
+
+    writer = SnapshotWriter(path, version)
+    failed = 0
+    try:
+        for keyword, result in lookup.search(keywords, sources, return_exceptions=True, window=window):
+            for source, data in result.items():
+                if isinstance(data, Exception):
+                    failed += 1
+                    logging.warning('Skip {} in {}: {}'.format(keyword, source, data))
+                else:
+                    writer.add(source, getattr(engines[source], 'language', None), slug(keyword), data)
+    except BaseException:
+        writer.abort()
+        raise
+    count = writer.close()
+    logging.info('Wrote {} records into {} version {}, {} lookups failed'.format(count, path, writer.version, failed))
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or inspect the read-only offline snapshot')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='look up every line of a word list and pack the results')
+    build_parser.add_argument('word_list')
+    build_parser.add_argument('-o', '--output', default=None, help='defaults to ENGLIPEDIA_SNAPSHOT or snapshot.bin in the cache directory')
+    build_parser.add_argument('-s', '--sources', nargs='+', default=['Cambridge', 'Merriam', 'Etymology'], choices=['Cambridge', 'Merriam', 'Etymology'])
+    build_parser.add_argument('-t', '--translate', action='store_true')
+    build_parser.add_argument('--max-workers', type=int, default=16)
+    build_parser.add_argument('--per-host', type=int, default=4)
+    build_parser.add_argument('--version', type=int, default=None, help='defaults to the build time')
+
+    info_parser = commands.add_parser('info', help='print the version and size of a snapshot')
+    info_parser.add_argument('path', nargs='?', default=None)
+    args = parser.parse_args(argv)
+
+    from . import log  # noqa: F401
+    if args.command == 'build':
+        build(args.word_list, args.output or snapshot_path(), args.sources, args.translate, args.max_workers, args.per_host, version=args.version)
+    else:
+        snapshot = Snapshot(args.path or snapshot_path())
+        print('{}: format {}, version {}, {} records, {} bytes'.format(snapshot.path, FORMAT, snapshot.version, len(snapshot), len(snapshot.mm)), file=sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,57 @@
 import re
 import sys
-import requests
+
+from . import metrics
+from .cache import get_cache
+from .client import get_client
+
+
+class PageNotFound(Exception):
+
+    # the 404 page comes along so the caller can still remember the miss
+    def __init__(self, url, page):
+        super().__init__('{} was not found'.format(url))
+        self.url  = url
+        self.page = page
+
+
+def fetch_page(url):
+    # returns the canonical url the page was served from together with the page
+    cache     = get_cache()
+    canonical = cache.canonical(url)
+    page      = cache.get_page(canonical)
+    metrics.inc('page_cache', result='miss' if page is None else 'hit')
+    if page is None:
+        response = get_client().get(url)
+        if response.status_code == 404:
+            raise PageNotFound(url, response.content)
+        # bot blocks and other error pages must never reach a parser or the cache
+        response.raise_for_status()
+        page      = response.content
+        canonical = response.url
+        cache.put_canonical(url, canonical)
+        cache.put_page(canonical, page)
+    return canonical, page
 
 
 def download_page(url):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_2) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/47.0.2526.80 Safari/537.36'
-    }
-    data = requests.get(url, headers=headers).content
-    return data
+    return fetch_page(url)[1]
+
+WORD_PATTERN = re.compile(r'[\w ]+')
+
 
 def rebuild_string(strings):
-	parser = re.compile(r'[\w ]+')
-	result = ''
+	# join with spaces, except that punctuation sticks to the text before it
+	parts = []
 	for string in strings:
-		if parser.match(string):
-			result += (string + ' ')
-		else:
-			result = result.strip() + string + ' '
-	return result.strip()
+		if not WORD_PATTERN.match(string):
+			while parts and not parts[-1].strip():
+				parts.pop()
+			if parts:
+				parts[-1] = parts[-1].rstrip()
+		parts.append(string)
+		parts.append(' ')
+	return ''.join(parts).strip()
 
 def myprint(string='', head=0, end='', file=sys.stdout):
 	print(' ' * head + string, end=end, file=file)
\ No newline at end of file
@@ -1,35 +1,53 @@
 import os
 import sys
-import requests
+import asyncio
 
 from ipywidgets import GridspecLayout
 from IPython.display import display, Image, FileLink
-from ipywidgets.widgets import Checkbox, Label, Box, HBox, Button, Textarea, Layout, Output, HTML
-from .dict import CamBridge, MerriamWebster, OnlineEtymology
-from .util import myprint
+from ipywidgets.widgets import Checkbox, Label, Box, HBox, Button, Textarea, Layout, Output, HTML, IntProgress, Dropdown
+from .engine import LookupEngine, Fanout, create_engines
+from .media import get_media
+from .plan import Plan
+from .render import Renderer
+from .export import export, FORMATS
 
 class UI:
 
-    def __init__(self):
+    def __init__(self, max_workers=16, per_host=4, debounce=0.1, thumbnail=None, image_timeout=10):
+        self.max_workers = max_workers
+        self.per_host    = per_host
+        self.debounce    = debounce
+        self.renderer    = Renderer()
+        self.thumbnail   = thumbnail
+        self.image_timeout = image_timeout
+        self.pending_render = None
         self.setting = self.create_settings()
         self.keyword = Textarea(value='', placeholder='Search dictionary and press enter', description='', disabled=False, rows=1, layout=Layout(width='50%'))
         self.search_button  = self.create_button('search')
         self.save_button  = self.create_button('save file')
+        self.save_format  = Dropdown(options=[fmt + suffix for fmt in FORMATS for suffix in ('', '.gz')], value='txt', layout=Layout(width='120px'))
+        self.cancel_button = self.create_button('cancel')
+        self.cancel_button.disabled = True
+        self.progress = IntProgress(value=0, min=0, max=1)
+        self.status  = Label('')
         self.out     = Output()
         self.results = {}
+        self.task    = None
 
         self.search_button.on_click(self.search)
         self.save_button.on_click(self.save_file)
+        self.cancel_button.on_click(self.cancel_search)
         self.keyword.observe(self.adjust_keyword_size, 'value')
 
     def adjust_keyword_size(self, event):
         self.keyword.rows = self.keyword.value.count('\n') + 1
 
     def save_file(self, event):
-        filename = 'result.txt'
-        with open(filename, 'w') as fp:
-            self.show_result(file=fp)
-        self.out.clear_output()
+        filename = 'result.' + self.save_format.value
+        count = export(self.results.items(), filename, self.get_config()['fields'])
+        with self.out:
+            print('Saved {} keywords to'.format(count))
+            display(FileLink(filename))
 
     def get_config(self):
         return {
@@ -45,99 +63,138 @@ class UI:
             }
         }
 
-    def show_result(self, event=None, file=sys.stdout):
+    def schedule_render(self, event=None):
+        # coalesce a burst of toggles into one render on the kernel's event loop
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.show_result()
+        if self.pending_render:
+            self.pending_render.cancel()
+        self.pending_render = loop.call_later(self.debounce, self.show_result)
+
+    def show_image(self, url):
+        # rendering only reads the media store, the download was started by the search;
+        # on the kernel's loop a chart still downloading is filled in once it lands
+        media  = get_media()
+        data   = media.get(url, size=self.thumbnail)
+        future = media.pending(url) if data is None else None
+        if future is not None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop:
+                handle = display(HTML(''), display_id=True)
+                loop.create_task(self.fill_image(handle, url, future))
+                return
+            data = media.get(url, size=self.thumbnail, timeout=self.image_timeout)
+        if data is None:
+            print(' ' * 12 + '(image unavailable)')
+        else:
+            display(Image(data))
+
+    async def fill_image(self, handle, url, future):
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.image_timeout)
+        except asyncio.TimeoutError:
+            pass
+        data = get_media().get(url, size=self.thumbnail)
+        handle.update(Image(data) if data is not None else HTML('<pre>{}(image unavailable)</pre>'.format(' ' * 12)))
+
+    def show_result(self, event=None, file=None):
+        self.pending_render = None
         if not self.results:
             return
         self.out.clear_output()
-        fields = self.get_config()['fields']
-        word_field = fields['Cambridge']['word']
-        phrase_field = fields['Cambridge']['phrase']
-        translate = fields['translate']['requirment']
         with self.out:
-            for keyword, result in self.results.items():
-                myprint(keyword + ':', end='\n', file=file)
-                myprint('*' * 10, end='\n', file=file)
-                for word in result.get('Cambridge', []):
-                    myprint(word['text'], head=4, file=file)
-                    myprint('(part-of-speech: {})'.format(word['pos']) if word_field['pos'] else '', end='\n', file=file)
-
-                    defines = word['defines'] if word_field['define'] else []
-                    for idx, define in enumerate(defines):
-                        grammar = define.get('grammar', word.get('grammar', None))
-                        myprint('define {}: {}'.format(idx, define['define']['text']), head=8, file=file)
-                        myprint('({})'.format(define['define']['translate']) if translate and define['define']['text'] else '', head=1, file=file)
-                        myprint('[{}]'.format(grammar) if word_field['grammar'] else '', end='\n', head=1, file=file)
-
-                        examples = define['examples'] if word_field['examples'] else []
-                        for ex_idx, example in enumerate(examples):
-                            myprint('- example {}: {}'.format(ex_idx, example['text']), head=12, file=file)
-                            myprint('({})'.format(example['translate']) if translate and example['text'] else '', end='\n', head=1, file=file)
-
-                        phrases = define['phrases'] if phrase_field['text'] else []
-                        for ph_idx, phrase in enumerate(phrases):
-                            myprint('* phrase {}: {}'.format(ph_idx, phrase['phrase']), head=12, end='\n', file=file)
-                            myprint('define: {}'.format(phrase['define']['text'] if phrase_field['define'] else ''), head=16, file=file)
-                            myprint('({})'.format(phrase['define']['translate']) if translate and phrase_field['define'] else '', end='\n', head=1, file=file)
-
-                            examples = phrase['examples'] if phrase_field['examples'] else []
-                            for ex_idx, example in enumerate(examples):
-                                myprint('- example {}: {}'.format(ex_idx, example['text']), head=20, file=file)
-                                myprint('({})'.format(example['translate'] if translate and example['text'] else ''), end='\n', head=1, file=file)
-                    myprint(end='\n', file=file)
-
-                merriam_field = fields['Merriam']
-                if result.get('Merriam') and (merriam_field['first use'] or merriam_field['etymology']):
-                    myprint('In Merriam webster:', end='\n', head=4, file=file)
-                    if merriam_field['first use']:
-                        myprint('First known use:', head=8, end='\n', file=file)
-                        self.print_merriam(result['Merriam']['first_known_use'], file=file)
-
-                    if merriam_field['etymology']:
-                        myprint('Etymology:', head=8, end='\n', file=file)
-                        self.print_merriam(result['Merriam']['etymology'], file=file)
-
-                etymology_field = fields['Etymology']
-                if result.get('Etymology') and (etymology_field['description'] or etymology_field['image(if any)']):
-                    myprint('In etymology online:', end='\n', head=4, file=file)
-                    if etymology_field['description']:
-                        myprint('Description:', head=8, end='\n', file=file)
-                        data = result['Etymology']['text']
-                        myprint(data if data else 'No data', head=12, end='\n', file=file)
-                    if etymology_field['image(if any)'] and result['Etymology']['image_url']:
-                        display(Image(requests.get(result['Etymology']['image_url']).content))
-                        myprint(end='\n', file=file)
-                myprint('=' * 75, end='\n', file=file)
-
-    def print_merriam(self, data, file=sys.stdout):
-        if data:
-            for d in data:
-                if d['type']:
-                    myprint('part-of-speech: {}'.format(d['type']), head=12, end='\n', file=file)
-                myprint(d['text'], head=12, end='\n', file=file)
-                myprint(file=file)
-        else:
-            myprint(data if data else 'No data', head=8, end='\n', file=file)
+            self.renderer.write(self.results, self.get_config()['fields'], file or sys.stdout, self.show_image)
 
     def search(self, event):
         self.out.clear_output()
         config = self.get_config()
         dict_names = config['dictionary']
-        engine  = {
-            'Cambridge': CamBridge('chinese-traditional' if config['fields']['translate']['requirment'] else None ),
-            'Merriam': MerriamWebster(),
-            'Etymology': OnlineEtymology()
-        }
-        if self.keyword.value:
+        lookup = LookupEngine(create_engines(config['fields']['translate']['requirment'], media=True), max_workers=self.max_workers, per_host=self.per_host)
+        plan = Plan(self.keyword.value.split('\n'))
+        if plan:
+            self.cancel_search()
             self.results = {}
+            self.renderer.clear()
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop:
+                self.task = loop.create_task(self.search_async(lookup, plan, dict_names))
+                return
             with self.out:
-                for keyword in self.keyword.value.split('\n'):
-                    print('search {}...'.format(keyword))
-                    self.results[keyword] = {dict_name : engine[dict_name].search(keyword.strip()) for dict_name in dict_names}
+                print('search {}...'.format(', '.join(plan.keywords)))
+                self.results = plan.fan_out(dict(lookup.search(plan.keywords, dict_names)))
                 self.show_result()
         else:
             with self.out:
                 print('The keyword in search bar is required.')
 
+    def cancel_search(self, event=None):
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    def advance(self, lookup, owner, future):
+        # cancelled lookups of a replaced search must not move the newer one's bar
+        if future.cancelled() or self.task is not owner:
+            return
+        self.progress.value += 1
+        self.status.value = '  '.join('{}: {:.2f}s'.format(name, latency) for name, latency in lookup.mean_latency().items())
+
+    async def search_async(self, lookup, plan, dict_names):
+        # render every keyword as soon as all of its sources are back, keep
+        # whatever finished when a lookup fails or the search is cancelled
+        fanout = Fanout(lookup, dict_names)
+        fields = self.get_config()['fields']
+        self.progress.max   = len(plan) * len(dict_names)
+        self.progress.value = 0
+        self.status.value   = ''
+        self.cancel_button.disabled = False
+        errors, done, cancelled = [], {}, False
+        owner = asyncio.current_task()
+
+        async def collect(keyword, futures):
+            result = {}
+            for name, future in futures.items():
+                future = asyncio.wrap_future(future)
+                future.add_done_callback(lambda future: self.advance(lookup, owner, future))
+                futures[name] = future
+            for name, future in futures.items():
+                try:
+                    result[name] = await future
+                except Exception as error:
+                    errors.append('{} failed for "{}": {}'.format(name, keyword, error))
+            return keyword, result
+
+        tasks = [asyncio.ensure_future(collect(keyword, fanout.submit(keyword))) for keyword in plan.keywords]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                keyword, result = await next_done
+                done[keyword] = result
+                with self.out:
+                    self.renderer.write({keyword: result}, fields, sys.stdout, self.show_image)
+        except asyncio.CancelledError:
+            cancelled = True
+            for task in tasks:
+                task.cancel()
+        finally:
+            fanout.close()
+            # a search replaced by a newer one must leave the newer one's state alone
+            if self.task is owner:
+                self.cancel_button.disabled = True
+                self.results = plan.fan_out(done)
+                self.show_result()
+                with self.out:
+                    for error in errors:
+                        print(error)
+                    if cancelled:
+                        print('Search cancelled, {} of {} keywords finished.'.format(len(done), len(plan)))
+
     def create_settings(self):
         word       = self.create_checkbox('define', 'pos', 'grammar', 'examples')
         phrase     = self.create_checkbox('text', 'define', 'examples')
@@ -166,7 +223,7 @@ class UI:
     def create_checkbox(self, *options, default=True):
         box = [Checkbox(value=default, description=dict_name, disabled=False, indent=False) for dict_name in options]
         for c in box:
-            c.observe(self.show_result)
+            c.observe(self.schedule_render, names='value')
         return box
 
     def create_button(self, name):
@@ -176,8 +233,9 @@ class UI:
     def run(self):
         display(self.keyword)
         display(self.search_button)
+        display(HBox([self.progress, self.cancel_button, self.status]))
         display(self.setting)
-        display(self.save_button)
+        display(HBox([self.save_button, self.save_format]))
         display(self.out)
 
         style = """